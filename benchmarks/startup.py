@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+import statistics
+import subprocess
+from typing import List
+
+
+# Modules that must never be imported by the hot CLI commands
+FORBIDDEN_MODULES = ("fire", "flask", "waitress")
+
+
+def timeit(command: List[str], env: dict, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def imported_modules(command: List[str], env: dict) -> List[str]:
+    output = subprocess.run(
+        [command[0], "-X", "importtime", *command[1:]],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    return [
+        line.rsplit("|", 1)[-1].strip()
+        for line in output.splitlines()
+        if line.startswith("import time:")
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SEMQ CLI startup-time benchmark")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-overhead-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as metastore_path:
+        env = {
+            **os.environ,
+            "SEMQ_DEFAULT_METASTORE_PATH": metastore_path,
+            "SEMQ_DEFAULT_LOGGING_LEVEL": "WARNING",
+        }
+        subprocess.run(
+            [sys.executable, "-m", "semq", "setup", "--name", "bench"],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        commands = {
+            "baseline": [sys.executable, "-c", "pass"],
+            "put": [sys.executable, "-m", "semq", "put", "--name", "bench", "--item", "hello"],
+            "get": [sys.executable, "-m", "semq", "get", "--name", "bench"],
+        }
+        baseline = timeit(commands["baseline"], env=env, runs=args.runs)
+        print(f"{'baseline':10s} {baseline:8.2f} ms")
+        failures = []
+        for name in ("put", "get"):
+            elapsed = timeit(commands[name], env=env, runs=args.runs)
+            overhead = elapsed - baseline
+            print(f"{name:10s} {elapsed:8.2f} ms (overhead: {overhead:.2f} ms)")
+            if args.max_overhead_ms is not None and overhead > args.max_overhead_ms:
+                failures.append(f"{name}: startup overhead {overhead:.2f} ms > {args.max_overhead_ms} ms")
+            forbidden = [
+                module
+                for module in imported_modules(commands[name], env=env)
+                if module.split(".")[0] in FORBIDDEN_MODULES
+            ]
+            if forbidden:
+                failures.append(f"{name}: imports {', '.join(sorted(set(forbidden)))}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,6 @@
-from .q import SimpleExternalQueue
+def __getattr__(name: str):
+    # Lazy import; keeps the package import (and the CLI startup) lean
+    if name == "SimpleExternalQueue":
+        from .q import SimpleExternalQueue
+        return SimpleExternalQueue
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,11 @@
-import fire
+import sys
 
-from .cli import CLI
+from .cli import run_fast_path
 
 
 if __name__ == "__main__":
-    fire.Fire(CLI())
+    # Hot commands skip the `fire` introspection entirely
+    if not run_fast_path(argv=sys.argv[1:]):
+        import fire
+        from .cli import CLI
+        fire.Fire(CLI())
@@ -0,0 +1,143 @@
+import os
+import mmap
+import uuid
+import shutil
+import hashlib
+from typing import Dict
+from dataclasses import dataclass
+
+from .exceptions import (
+    BlobReferenceNotFound,
+)
+from .settings import (
+    get_logger,
+)
+
+
+logger = get_logger(name=__name__)
+
+
+class BlobHandle:
+    # The file descriptor is opened eagerly so the content stays readable even if the
+    # partition gets retired (and its blobs reclaimed) before the consumer reads it.
+
+    def __init__(self, filepath: str, digest: str, size: int):
+        self.filepath = filepath
+        self.digest = digest
+        self.size = size
+        self._file = open(filepath, "rb")
+
+    def __repr__(self) -> str:
+        return f"BlobHandle(digest={self.digest!r}, size={self.size})"
+
+    def __enter__(self) -> 'BlobHandle':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def path(self) -> str:
+        return self.filepath
+
+    def mmap(self) -> mmap.mmap:
+        return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_bytes(self) -> bytes:
+        return os.pread(self._file.fileno(), self.size, 0)
+
+    def read_text(self, encoding: str = "utf-8") -> str:
+        return self.read_bytes().decode(encoding)
+
+    def close(self):
+        self._file.close()
+
+
+@dataclass
+class BlobStore:
+    dirpath: str
+    threshold: int
+    # Keep the blobs of retired partition files (retention policy); they are reclaimed when purged
+    retain: bool = False
+
+    @property
+    def objects_dirpath(self) -> str:
+        return os.path.join(self.dirpath, "objects")
+
+    @property
+    def refs_dirpath(self) -> str:
+        return os.path.join(self.dirpath, "refs")
+
+    def get_object_filepath(self, digest: str) -> str:
+        return os.path.join(self.objects_dirpath, digest)
+
+    def get_reference_dirpath(self, partition_filepath: str) -> str:
+        return os.path.join(self.refs_dirpath, os.path.basename(partition_filepath))
+
+    def get_reference_filepath(self, partition_filepath: str, digest: str) -> str:
+        return os.path.join(self.get_reference_dirpath(partition_filepath), digest)
+
+    def should_spill(self, item: str) -> bool:
+        # Cheap pre-checks; the utf-8 encoding takes between one and four bytes per character
+        if self.threshold <= 0 or len(item) * 4 <= self.threshold:
+            return False
+        if len(item) > self.threshold:
+            return True
+        return len(item.encode("utf-8")) > self.threshold
+
+    def write(self, item: str, partition_filepath: str) -> Dict:
+        content = item.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        object_filepath = self.get_object_filepath(digest=digest)
+        reference_filepath = self.get_reference_filepath(partition_filepath=partition_filepath, digest=digest)
+        os.makedirs(self.objects_dirpath, exist_ok=True)
+        os.makedirs(os.path.dirname(reference_filepath), exist_ok=True)
+        # Each partition references the content-addressed object via a hard-link; the link count
+        # works as a reference counter that survives concurrent producers and consumers.
+        try:
+            os.link(object_filepath, reference_filepath)
+        except FileExistsError:
+            logger.debug("Blob %s already referenced by partition file", digest)
+        except FileNotFoundError:
+            tmp_filepath = f"{object_filepath}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_filepath, "wb") as file:
+                file.write(content)
+            try:
+                os.link(tmp_filepath, reference_filepath)
+            except FileExistsError:
+                logger.debug("Blob %s already referenced by partition file", digest)
+            os.replace(tmp_filepath, object_filepath)
+        return {
+            "digest": digest,
+            "size": len(content),
+        }
+
+    def open(self, reference: Dict, partition_filepath: str) -> BlobHandle:
+        digest = reference["digest"]
+        try:
+            return BlobHandle(
+                filepath=self.get_reference_filepath(partition_filepath=partition_filepath, digest=digest),
+                digest=digest,
+                size=reference["size"],
+            )
+        except FileNotFoundError:
+            raise BlobReferenceNotFound(digest=digest, partition_file=partition_filepath)
+
+    def reclaim(self, partition_filepath: str, force: bool = False) -> int:
+        reference_dirpath = self.get_reference_dirpath(partition_filepath=partition_filepath)
+        if (self.retain and not force) or not os.path.isdir(reference_dirpath):
+            return 0
+        reclaimed = 0
+        for digest in os.listdir(reference_dirpath):
+            os.remove(os.path.join(reference_dirpath, digest))
+            object_filepath = self.get_object_filepath(digest=digest)
+            try:
+                # Only the object itself is left; no other partition references this content
+                if os.stat(object_filepath).st_nlink <= 1:
+                    os.remove(object_filepath)
+                    reclaimed += 1
+            except FileNotFoundError:
+                continue
+        shutil.rmtree(reference_dirpath, ignore_errors=True)
+        logger.debug("Reclaimed %d blobs from partition file: %s", reclaimed, partition_filepath)
+        return reclaimed
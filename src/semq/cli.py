@@ -1,6 +1,8 @@
+import sys
+import ast
 import json
 import datetime as dt
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from .settings import (
     get_logger,
@@ -15,6 +17,25 @@ from .metastore import PartitionFile
 logger = get_logger(name=__name__)
 
 
+# Commands served without `fire` (see `run_fast_path`) and the type of their accepted flags
+CLI_FAST_PATH_COMMANDS = {
+    "put": {
+        "name": str,
+        # Any literal; non-string items are serialized by `put`
+        "item": object,
+        "hashing": bool,
+        "stdin": bool,
+    },
+    "get": {
+        "name": str,
+        "wait_seconds": int,
+        "fail": bool,
+        "count": int,
+        "group": str,
+    },
+}
+
+
 class CLIServer:
 
     def run(
@@ -79,6 +100,64 @@ class CLI:
     def discover(metastore_path: Optional[str] = None) -> List[Dict]:
         return SimpleExternalQueue.discover(metastore_path=metastore_path)
 
+    @staticmethod
+    def status(
+            metastore_path: Optional[str] = None,
+            pattern: Optional[str] = None,
+            offset: int = 0,
+            limit: Optional[int] = None,
+            min_depth: Optional[int] = None,
+    ) -> Dict:
+        return SimpleExternalQueue.status(
+            metastore_path=metastore_path,
+            pattern=pattern,
+            offset=offset,
+            limit=limit,
+            min_depth=min_depth,
+        )
+
+    def groups(self, name: str, metastore_path: Optional[str] = None) -> List[str]:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path)
+        return queue.groups()
+
+    def register_group(self, name: str, group: str, metastore_path: Optional[str] = None) -> List[str]:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path, group=group)
+        queue.setup()
+        return queue.groups()
+
+    def unregister_group(self, name: str, group: str, metastore_path: Optional[str] = None) -> List[str]:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path, group=group)
+        return queue.unregister_group()
+
+    def fsck(
+            self,
+            name: str,
+            metastore_path: Optional[str] = None,
+            full: bool = False,
+            grace_seconds: Optional[float] = None,
+    ) -> Dict:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path, recovery=False)
+        return queue.recover(full=full, grace_seconds=grace_seconds)
+
+    def replay(
+            self,
+            name: str,
+            since: Optional[str] = None,
+            until: Optional[str] = None,
+            metastore_path: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path)
+        return queue.replay(since=since, until=until, resolve_blobs=True)
+
+    def retention(
+            self,
+            name: str,
+            retention_seconds: Optional[float] = None,
+            metastore_path: Optional[str] = None,
+    ) -> List[str]:
+        queue = SimpleExternalQueue(name=name, metastore_path=metastore_path, retention_seconds=retention_seconds)
+        return queue.apply_retention()
+
     def pfile_put(self, name: str):
         fsq = SimpleExternalQueue(name=name)
         partition_file = fsq.partition_file_operation_put()
@@ -119,22 +198,162 @@ class CLI:
             name: str,
             metastore_path: Optional[str] = None,
             pfiles_only: bool = False,
-            ignore_requests: bool = False
+            ignore_requests: bool = False,
+            group: Optional[str] = None,
     ):
         fsq = SimpleExternalQueue(
             name=name,
             metastore_path=metastore_path,
+            group=group,
         )
         return fsq.size(
             include_items=not pfiles_only,
             ignore_requests=ignore_requests
         )
 
-    def put(self, name: str, item: Union[Dict, str], hashing: bool = False) -> Dict:
+    def put(
+            self,
+            name: str,
+            item: Optional[Union[Dict, str]] = None,
+            hashing: bool = False,
+            stdin: bool = False,
+    ) -> Union[Dict, Iterator[Dict]]:
         queue = SimpleExternalQueue(name=name, item_hashing=hashing)
+        if stdin:
+            return self._put_stream(queue=queue, hashing=hashing)
+        if item is None:
+            raise ValueError("Either an item or the stdin flag needs to be provided")
         item = item if isinstance(item, str) else json.dumps(item)  # Serialize the item if needed
         return queue.put(item=item, item_hashing=hashing)
 
-    def get(self, name: str, wait_seconds: int = -1, fail: bool = False) -> Dict:
-        queue = SimpleExternalQueue(name=name)
-        return queue.get(wait_seconds=wait_seconds, fail=fail)
+    @staticmethod
+    def _put_stream(queue: SimpleExternalQueue, hashing: bool = False) -> Iterator[Dict]:
+        # One item per (non-empty) line
+        for line in sys.stdin:
+            item = line.rstrip("\n")
+            if not item:
+                continue
+            yield queue.put(item=item, item_hashing=hashing)
+
+    def get(
+            self,
+            name: str,
+            wait_seconds: int = -1,
+            fail: bool = False,
+            count: int = 1,
+            group: Optional[str] = None,
+    ) -> Union[Optional[Dict], Iterator[Dict]]:
+        queue = SimpleExternalQueue(name=name, group=group)
+        if count != 1:
+            return self._get_stream(queue=queue, wait_seconds=wait_seconds, fail=fail, count=count)
+        return queue.get(wait_seconds=wait_seconds, fail=fail, resolve_blobs=True)
+
+    @staticmethod
+    def _get_stream(
+            queue: SimpleExternalQueue,
+            wait_seconds: int = -1,
+            fail: bool = False,
+            count: int = 1,
+    ) -> Iterator[Dict]:
+        # A non-positive count drains the queue
+        retrieved = 0
+        while count < 1 or retrieved < count:
+            payload = queue.get(wait_seconds=wait_seconds, fail=fail, resolve_blobs=True)
+            if payload is None:
+                return
+            retrieved += 1
+            yield payload
+
+
+def parse_fast_path_value(value: str):
+    # Same literal rules as `fire` (bare words are strings; anything else that is not a literal stays a raw string)
+    try:
+        root = ast.parse(value, mode="eval")
+        if isinstance(root.body, ast.BinOp):
+            return value
+        for node in ast.walk(root):
+            for name, child in ast.iter_fields(node):
+                children = child if isinstance(child, list) else [child]
+                for index, subchild in enumerate(children):
+                    if isinstance(subchild, ast.Name) and subchild.id not in ("True", "False", "None"):
+                        children[index] = ast.Constant(value=subchild.id)
+                if not isinstance(child, list):
+                    setattr(node, name, children[0])
+        return ast.literal_eval(root)
+    except (SyntaxError, ValueError):
+        return value
+
+
+def parse_fast_path_arguments(argv: List[str]) -> Optional[Tuple[str, Dict]]:
+    # Returns None whenever the arguments are not trivially parsable; `fire` takes over in that case
+    if not argv or argv[0] not in CLI_FAST_PATH_COMMANDS:
+        return None
+    command, flags = argv[0], CLI_FAST_PATH_COMMANDS[argv[0]]
+    kwargs: Dict[str, object] = {}
+    arguments = argv[1:]
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        index += 1
+        if not argument.startswith("--"):
+            return None
+        key, separator, value = argument[2:].partition("=")
+        key = key.replace("-", "_")
+        # Boolean flags: --flag, --noflag, --flag=<bool>
+        if not separator and key.startswith("no") and flags.get(key[2:]) is bool:
+            kwargs[key[2:]] = False
+            continue
+        if key not in flags:
+            return None
+        if not separator:
+            # Like `fire`, a flag followed by another flag (or by nothing) is a boolean one
+            if index == len(arguments) or arguments[index].startswith("--"):
+                if flags[key] is not bool:
+                    return None
+                kwargs[key] = True
+                continue
+            if flags[key] is bool:
+                return None
+            value = arguments[index]
+            index += 1
+        parsed = parse_fast_path_value(value)
+        if not isinstance(parsed, flags[key]) or (flags[key] is int and isinstance(parsed, bool)):
+            return None
+        kwargs[key] = parsed
+    if "name" not in kwargs:
+        return None
+    return command, kwargs
+
+
+def format_fast_path_value(value) -> str:
+    if isinstance(value, str):
+        return value.replace("\n", " ")
+    return json.dumps(value, ensure_ascii=False)
+
+
+def format_fast_path_result(result: Dict) -> str:
+    # Mirrors the `fire` output format so both paths print the same
+    if not result:
+        return "{}"
+    padding = max(len(key) for key in result) + 1
+    return "\n".join(
+        f"{key + ':':{padding}s} {format_fast_path_value(value)}"
+        for key, value in result.items()
+    )
+
+
+def run_fast_path(argv: List[str]) -> bool:
+    parsed = parse_fast_path_arguments(argv=argv)
+    if parsed is None:
+        return False
+    command, kwargs = parsed
+    result = getattr(CLI(), command)(**kwargs)
+    if result is None:
+        return True
+    if isinstance(result, dict):
+        print(format_fast_path_result(result))
+        return True
+    # Streaming mode; one json line per item
+    for payload in result:
+        print(format_fast_path_value(payload), flush=True)
+    return True
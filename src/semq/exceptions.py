@@ -12,3 +12,35 @@ class RequestIdentifierNotFoundInRequestFile(Exception):
         self.req_id = req_id
         self.req_file = req_file
         super().__init__(f"Request ID {req_id} not found in request file: {req_file}")
+
+
+class BlobReferenceNotFound(Exception):
+
+    def __init__(self, digest: str, partition_file: str):
+        self.digest = digest
+        self.partition_file = partition_file
+        super().__init__(f"Blob {digest} not found for partition file: {partition_file}")
+
+
+class CorruptedRecordInPartitionFile(Exception):
+
+    def __init__(self, position: int, partition_file: str):
+        self.position = position
+        self.partition_file = partition_file
+        super().__init__(f"Corrupted record at position {position} in partition file: {partition_file}")
+
+
+class MemoryTierNotEmpty(Exception):
+
+    def __init__(self, path: str, group: str):
+        self.path = path
+        self.group = group
+        super().__init__(f"Consumer group {group} cannot be registered while the memory tier holds items: {path}")
+
+
+class ConsumerGroupNotRegistered(Exception):
+
+    def __init__(self, group: str, path: str):
+        self.group = group
+        self.path = path
+        super().__init__(f"Consumer group {group} not registered (see register-group): {path}")
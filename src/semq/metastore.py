@@ -1,19 +1,23 @@
 import os
+import re
 import uuid
 import json
 import enum
 import time
 import shutil
 import datetime as dt
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Callable, Dict, List, Set, Tuple, Optional
 from dataclasses import dataclass
 
-from .utils import get_new_partition_filepath
+from .utils import count_newlines, get_new_partition_filepath, get_record_checksum, truncate_torn_tail
+from .blobstore import BlobStore
 from .exceptions import (
     UnavailablePartitionFiles,
 )
 from .settings import (
     get_logger,
+    SEMQ_DEFAULT_CONSUMER_GROUP,
+    SEMQ_DEFAULT_TIME_INDEX_INTERVAL,
 )
 
 
@@ -23,6 +27,19 @@ logger = get_logger(name=__name__)
 class FilePrefix(enum.Enum):
     REQ = "req"
     DEL = "del"
+    DONE = "done"
+    RETIRE = "retire"
+    IDX = "idx"
+
+    @staticmethod
+    def get_partition_name(filename: str) -> str:
+        # Neither group names nor partition file names contain dashes
+        return filename.rsplit("-", 1)[-1]
+
+    @staticmethod
+    def group_infix(group: Optional[str] = None) -> str:
+        # The default consumer group keeps the original (group-less) file names
+        return "" if not group or group == SEMQ_DEFAULT_CONSUMER_GROUP else f"{group}-"
 
     @classmethod
     def apply_prefix_delete(cls, filepath: str) -> str:
@@ -33,13 +50,75 @@ class FilePrefix(enum.Enum):
         )
 
     @classmethod
-    def apply_prefix_request(cls, filepath: str) -> str:
+    def apply_prefix_index(cls, filepath: str) -> str:
         directory, file = os.path.dirname(filepath), os.path.basename(filepath)
         return os.path.join(
             directory,
-            f"{cls.REQ.value}-{file}",
+            f"{cls.IDX.value}-{file}",
         )
 
+    @classmethod
+    def apply_prefix_retire(cls, filepath: str) -> str:
+        directory, file = os.path.dirname(filepath), os.path.basename(filepath)
+        return os.path.join(
+            directory,
+            f"{cls.RETIRE.value}-{file}",
+        )
+
+    @classmethod
+    def apply_prefix_request(cls, filepath: str, group: Optional[str] = None) -> str:
+        directory, file = os.path.dirname(filepath), os.path.basename(filepath)
+        return os.path.join(
+            directory,
+            f"{cls.REQ.value}-{cls.group_infix(group)}{file}",
+        )
+
+    @classmethod
+    def apply_prefix_done(cls, filepath: str, group: Optional[str] = None) -> str:
+        directory, file = os.path.dirname(filepath), os.path.basename(filepath)
+        return os.path.join(
+            directory,
+            f"{cls.DONE.value}-{cls.group_infix(group)}{file}",
+        )
+
+
+@dataclass
+class ConsumerGroupRegistry:
+    dirpath: str
+
+    name_pattern = re.compile(r"^[A-Za-z0-9_]+$")
+
+    @classmethod
+    def validate(cls, group: str) -> str:
+        if not cls.name_pattern.match(group):
+            raise ValueError(f"Invalid consumer group name (allowed characters: A-Z, a-z, 0-9, _): {group}")
+        return group
+
+    def get_filepath(self, group: str) -> str:
+        return os.path.join(self.dirpath, group)
+
+    def is_registered(self, group: str) -> bool:
+        return os.path.exists(self.get_filepath(group=group))
+
+    def register(self, group: str):
+        # Never creates the queue directory itself (FileNotFoundError if missing)
+        try:
+            os.mkdir(self.dirpath)
+        except FileExistsError:
+            pass
+        open(self.get_filepath(group=self.validate(group)), "a").close()
+
+    def unregister(self, group: str):
+        try:
+            os.remove(self.get_filepath(group=group))
+        except FileNotFoundError:
+            logger.warning("Consumer group not registered: %s", group)
+
+    def list(self) -> List[str]:
+        if not os.path.isdir(self.dirpath):
+            return []
+        return sorted(os.listdir(self.dirpath))
+
 
 class AbstractFile:
 
@@ -50,10 +129,7 @@ class AbstractFile:
     def size(self):
         if not os.path.exists(self.filepath):
             return 0
-        with open(self.filepath, "r") as file:
-            for i, _ in enumerate(file):
-                continue
-            return i + 1
+        return count_newlines(filepath=self.filepath)
 
     def create_if_not_exists(self):
         if not os.path.exists(self.filepath):
@@ -83,33 +159,73 @@ class RequestFile(AbstractFile):
     filepath: str
     partition_file: 'PartitionFile'
     trash_dirpath: Optional[str] = None
+    group: Optional[str] = None
+    group_registry: Optional[ConsumerGroupRegistry] = None
+    # Called whenever a partition file gets retired (e.g. to apply the retention policy)
+    on_retire: Optional[Callable[[], Any]] = None
 
     def refresh(self, wait_seconds: int = -1) -> 'RequestFile':
-        partition_file_configs = {
+        partition_file_configs: Dict[str, Any] = {
             "max_size": self.partition_file.max_size,
             "path": os.path.dirname(self.partition_file.filepath),
             "wait_seconds": wait_seconds,
+            "blob_store": self.partition_file.blob_store,
+            "group": self.group,
         }
-        # Delete partition file
-        self.partition_file.soft_delete(trash_dirpath=self.trash_dirpath)
-        # Delete request file
-        self.soft_delete(trash_dirpath=self.trash_dirpath)
+        groups = self.group_registry.list() if self.group_registry else []
+        if not set(groups) - {self.group or SEMQ_DEFAULT_CONSUMER_GROUP}:
+            # Single consumer group; retire the partition file (and request file) right away
+            self.partition_file.retire(trash_dirpath=self.trash_dirpath, companion_filepaths=[self.filepath])
+            if self.on_retire:
+                self.on_retire()
+        else:
+            # Other groups may still read this partition file; producers append to the youngest one only (the
+            # producers partition size may differ from ours, so it cannot tell whether the file is exhausted)
+            youngest, _, _, _ = self.partition_file.files_info(path=os.path.dirname(self.partition_file.filepath))
+            if os.path.basename(self.partition_file.filepath) == youngest:
+                logger.warning("Partition file exhausted for consumer group: %s", self.group)
+                if wait_seconds < 1:
+                    raise UnavailablePartitionFiles(path=self.partition_file.filepath)
+                time.sleep(wait_seconds)
+                return self
+            self.complete()
+            retired = self.partition_file.retire_if_completed(groups=groups, trash_dirpath=self.trash_dirpath)
+            if retired and self.on_retire:
+                self.on_retire()
         # Create new partition file
         partition_file = self.partition_file.from_path_mode_get(**partition_file_configs)
-        return partition_file.get_request_file(trash_dirpath=self.trash_dirpath)
+        return partition_file.get_request_file(
+            trash_dirpath=self.trash_dirpath,
+            group=self.group,
+            group_registry=self.group_registry,
+            on_retire=self.on_retire,
+        )
+
+    def complete(self):
+        # Mark the partition file as consumed by this group
+        try:
+            os.rename(
+                self.filepath,
+                FilePrefix.apply_prefix_done(filepath=self.partition_file.filepath, group=self.group),
+            )
+        except FileNotFoundError:
+            logger.warning("Request file already completed: %s", self.filepath)
 
     def request(self, request_id: str, wait_seconds: int = -1):
         partition_file_size = self.partition_file.size
+        # A new request must not be glued onto a torn one
+        if truncate_torn_tail(filepath=self.filepath):
+            logger.warning("Torn request truncated from request file: %s", self.filepath)
 
         with open(self.filepath, "r+") as file:
-            for i, _ in enumerate(file):
-                if i + 1 >= partition_file_size:
-                    return self.refresh(wait_seconds=wait_seconds).request(
-                        request_id=request_id,
-                        wait_seconds=wait_seconds,
-                    )
-            file.write(request_id + "\n")
-        return self
+            # Never claim beyond the partition file (e.g. an empty one)
+            if sum(1 for _ in file) < partition_file_size:
+                file.write(request_id + "\n")
+                return self
+        return self.refresh(wait_seconds=wait_seconds).request(
+            request_id=request_id,
+            wait_seconds=wait_seconds,
+        )
 
 
 @dataclass
@@ -118,6 +234,8 @@ class PartitionFile(AbstractFile):
     max_size: int
     partition_files: Optional[int] = None
     item_hashing: bool = False
+    blob_store: Optional[BlobStore] = None
+    index_interval: int = SEMQ_DEFAULT_TIME_INDEX_INTERVAL
 
     class Mode(enum.Enum):
         PUT = 1
@@ -129,11 +247,13 @@ class PartitionFile(AbstractFile):
             path: str,
             max_size: int,
             item_hashing: bool = False,
+            blob_store: Optional[BlobStore] = None,
     ):
         return cls.from_path(
             mode=cls.Mode.PUT,
             max_size=max_size,
             path=path,
+            blob_store=blob_store,
             # PUT Config
             item_hashing=item_hashing,
         )
@@ -144,19 +264,33 @@ class PartitionFile(AbstractFile):
             path: str,
             max_size: int,
             wait_seconds: int = -1,
+            blob_store: Optional[BlobStore] = None,
+            group: Optional[str] = None,
     ):
         return cls.from_path(
             mode=cls.Mode.GET,
             max_size=max_size,
             path=path,
+            blob_store=blob_store,
             # GET Config
             wait_seconds=wait_seconds,
+            group=group,
         )
 
     @staticmethod
-    def files_info(path: str, accum: Optional[List] = None) -> Tuple[str, str, int, Optional[List]]:
+    def files_info(
+            path: str,
+            accum: Optional[List] = None,
+            group: Optional[str] = None,
+    ) -> Tuple[str, str, int, Optional[List]]:
         # Prefix to ignore
         prefix_options = tuple(prefix.value for prefix in FilePrefix)
+        files_listed = os.listdir(path)
+        # Partition files already consumed by the consumer group (if any) are ignored
+        completed: Set[str] = set()
+        if group:
+            done_prefix = os.path.basename(FilePrefix.apply_prefix_done(filepath="", group=group))
+            completed = {file[len(done_prefix):] for file in files_listed if file.startswith(done_prefix)}
         # Define the start and final values to compare with youngest or oldest
         youngest, oldest = "0000-00-00.000000.json", "9999-99-99.999999.json"
         # Initialize file counter to zero.
@@ -164,8 +298,8 @@ class PartitionFile(AbstractFile):
         accumulate = accum is not None
         # Start scanning
         logger.info("Scanning Path for partition files.")
-        for file in os.listdir(path):
-            if file.startswith(prefix_options) or not file.endswith(".json"):
+        for file in files_listed:
+            if file.startswith(prefix_options) or not file.endswith(".json") or file in completed:
                 continue
             logger.debug("> Partition file iter %d", files)
             # Find the oldest file for "get" scenario
@@ -185,8 +319,14 @@ class PartitionFile(AbstractFile):
             max_size: int,
             item_hashing: bool = False,
             wait_seconds: int = -1,
+            blob_store: Optional[BlobStore] = None,
+            group: Optional[str] = None,
     ):
-        youngest, oldest, files, _ = cls.files_info(path=path, accum=None)
+        youngest, oldest, files, _ = cls.files_info(
+            path=path,
+            accum=None,
+            group=group if mode == cls.Mode.GET else None,
+        )
         if not files and mode == cls.Mode.GET:
             logger.warning("Partition files not found in GET request")
             if wait_seconds < 1:
@@ -198,6 +338,8 @@ class PartitionFile(AbstractFile):
                 max_size=max_size,
                 mode=mode,
                 path=path,
+                blob_store=blob_store,
+                group=group,
             )
         reference = oldest if mode == cls.Mode.GET else youngest if mode == cls.Mode.PUT else None
         logger.debug("Reference partition file set to: %s", reference)
@@ -207,42 +349,112 @@ class PartitionFile(AbstractFile):
             max_size=max_size,
             partition_files=files,
             item_hashing=item_hashing,
+            blob_store=blob_store,
         ).create_if_not_exists()
 
-    def get_request_file(self, trash_dirpath: Optional[str] = None) -> RequestFile:
+    def get_request_file(
+            self,
+            trash_dirpath: Optional[str] = None,
+            group: Optional[str] = None,
+            group_registry: Optional[ConsumerGroupRegistry] = None,
+            on_retire: Optional[Callable[[], Any]] = None,
+    ) -> RequestFile:
         return RequestFile(
-            filepath=FilePrefix.apply_prefix_request(filepath=self.filepath),
+            filepath=FilePrefix.apply_prefix_request(filepath=self.filepath, group=group),
             partition_file=self,
-            trash_dirpath=trash_dirpath
+            trash_dirpath=trash_dirpath,
+            group=group,
+            group_registry=group_registry,
+            on_retire=on_retire,
         ).create_if_not_exists()
 
+    def retire(self, trash_dirpath: Optional[str] = None, companion_filepaths: Optional[List[str]] = None):
+        # The retire intent allows the recovery to complete (or revert) an interrupted retirement
+        intent_filepath = FilePrefix.apply_prefix_retire(filepath=self.filepath)
+        open(intent_filepath, "a").close()
+        # Delete partition file along with its request/done/index files
+        self.soft_delete(trash_dirpath=trash_dirpath)
+        index_filepath = FilePrefix.apply_prefix_index(filepath=self.filepath)
+        if os.path.exists(index_filepath):
+            companion_filepaths = [*(companion_filepaths or []), index_filepath]
+        for companion_filepath in companion_filepaths or []:
+            AbstractFile(filepath=companion_filepath).soft_delete(trash_dirpath=trash_dirpath)
+        try:
+            os.remove(intent_filepath)
+        except FileNotFoundError:
+            logger.debug("Retire intent already removed: %s", intent_filepath)
+        # Reclaim the blobs referenced by the retired partition file
+        if self.blob_store:
+            self.blob_store.reclaim(partition_filepath=self.filepath)
+
+    def retire_if_completed(self, groups: List[str], trash_dirpath: Optional[str] = None) -> bool:
+        done_filepaths = [FilePrefix.apply_prefix_done(filepath=self.filepath, group=group) for group in groups]
+        if not all(os.path.exists(done_filepath) for done_filepath in done_filepaths):
+            return False
+        logger.debug("Partition file consumed by all consumer groups: %s", self.filepath)
+        self.retire(trash_dirpath=trash_dirpath, companion_filepaths=done_filepaths)
+        return True
+
     @classmethod
-    def new(cls, path: str, max_size: int, partition_files: Optional[int] = None):
+    def new(
+            cls,
+            path: str,
+            max_size: int,
+            partition_files: Optional[int] = None,
+            item_hashing: bool = False,
+            blob_store: Optional[BlobStore] = None,
+    ):
         return cls(
             filepath=get_new_partition_filepath(file_path=path),
             max_size=max_size,
             partition_files=partition_files,
+            item_hashing=item_hashing,
+            blob_store=blob_store,
         ).create_if_not_exists()
 
-    def append(self, item: str) -> Tuple[Dict, 'PartitionFile']:
-        # Create the newline content
-        payload = {
-            "partition_filepath": self.filepath,
+    @staticmethod
+    def create_payload(item: str, item_hashing: bool = False, partition_filepath: Optional[str] = None) -> Dict:
+        return {
+            "partition_filepath": partition_filepath,
             "item_created_at": dt.datetime.utcnow().isoformat(),
             "item_id": str(
-                uuid.uuid4() if not self.item_hashing else uuid.uuid5(
+                uuid.uuid4() if not item_hashing else uuid.uuid5(
                     uuid.NAMESPACE_OID,
                     item,
                 )
             ),
             "item": item,
         }
-        line = json.dumps(payload) + "\n"
+
+    def append(self, item: str) -> Tuple[Dict, 'PartitionFile']:
+        # Create the newline content
+        payload = self.create_payload(item=item, item_hashing=self.item_hashing, partition_filepath=self.filepath)
+        spill = self.blob_store is not None and self.blob_store.should_spill(item=item)
+        # A new record must not be glued onto a torn one; the live tail cannot wait for the recovery grace period
+        if truncate_torn_tail(filepath=self.filepath):
+            logger.warning("Torn record truncated from partition file: %s", self.filepath)
+        position = 0
         with open(self.filepath, "r+") as file:
-            for i, _ in enumerate(file):
+            for position, _ in enumerate(file, start=1):
                 # Soft max validation; should we add a new line to current file or create a new one?
-                if i + 1 >= self.max_size:
-                    pfile = PartitionFile.new(path=os.path.dirname(self.filepath), max_size=self.max_size)
+                if position >= self.max_size:
+                    pfile = PartitionFile.new(
+                        path=os.path.dirname(self.filepath),
+                        max_size=self.max_size,
+                        item_hashing=self.item_hashing,
+                        blob_store=self.blob_store,
+                    )
                     return pfile.append(item=item)
-            file.write(line)
+            # Large items are spilled into the blob store; only a reference is kept in the partition file
+            if spill and self.blob_store is not None:
+                payload["item"] = None
+                payload["item_blob"] = self.blob_store.write(item=item, partition_filepath=self.filepath)
+            payload["record_checksum"] = get_record_checksum(payload=payload)
+            offset = os.fstat(file.fileno()).st_size
+            file.write(json.dumps(payload) + "\n")
+        # Sparse time index: record position, byte offset and creation time
+        # Seeking defaults to the start of the file; there's no need to index the first record
+        if self.index_interval > 0 and position > 0 and position % self.index_interval == 0:
+            with open(FilePrefix.apply_prefix_index(filepath=self.filepath), "a") as index_file:
+                index_file.write(f"{position} {offset} {payload['item_created_at']}\n")
         return payload, self
@@ -1,25 +1,48 @@
 import os
+import time
 import uuid
 import json
 import shutil
+import functools
+import hashlib
 import datetime as dt
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Set, Tuple, Optional, Union
 
-from .metastore import FilePrefix, PartitionFile, RequestFile
+from .metastore import AbstractFile, FilePrefix, PartitionFile, RequestFile, ConsumerGroupRegistry
+from .blobstore import BlobStore
+from .recovery import MetastoreRecovery
+from .replay import PartitionReplay
+from .stats import stats_cache
 from .exceptions import (
     UnavailablePartitionFiles,
     RequestIdentifierNotFoundInRequestFile,
+    CorruptedRecordInPartitionFile,
+    MemoryTierNotEmpty,
+    ConsumerGroupNotRegistered,
 )
+from .utils import get_record_checksum
 from .settings import (
     get_logger,
     SEMQ_DEFAULT_METASTORE_PATH,
     SEMQ_DEFAULT_PARTITION_SIZE,
     SEMQ_DEFAULT_METASTORE_TRASHDIR,
+    SEMQ_DEFAULT_METASTORE_BLOBDIR,
+    SEMQ_DEFAULT_BLOB_THRESHOLD,
+    SEMQ_DEFAULT_METASTORE_GROUPDIR,
+    SEMQ_DEFAULT_CONSUMER_GROUP,
+    SEMQ_DEFAULT_RECOVERY_ON_OPEN,
+    SEMQ_DEFAULT_RECOVERY_GRACE_SECONDS,
+    SEMQ_DEFAULT_MEMORY_TIER_SIZE,
+    SEMQ_DEFAULT_RETENTION_SECONDS,
+    SEMQ_DEFAULT_STATS_MAX_AGE_SECONDS,
 )
 
 
 logger = get_logger(name=__name__)
 
+# Queue metastore paths already recovered by this process
+recovered_queue_metastore_paths: Set[str] = set()
+
 
 class SimpleExternalQueue:
 
@@ -30,6 +53,13 @@ class SimpleExternalQueue:
             partition_file_size: Optional[int] = None,
             item_hashing: bool = False,
             trash_dirname: Optional[str] = None,
+            blob_dirname: Optional[str] = None,
+            blob_threshold: Optional[int] = None,
+            group: Optional[str] = None,
+            group_dirname: Optional[str] = None,
+            recovery: Optional[bool] = None,
+            memory_tier_size: Optional[int] = None,
+            retention_seconds: Optional[float] = None,
     ):
         self.name = name
         self.metastore_path = metastore_path or SEMQ_DEFAULT_METASTORE_PATH
@@ -38,15 +68,44 @@ class SimpleExternalQueue:
         self.item_hashing = item_hashing
         self.trash_dirname = trash_dirname or SEMQ_DEFAULT_METASTORE_TRASHDIR
         self.trash_dirpath = os.path.join(self.queue_metastore_path, self.trash_dirname)
+        self.blob_dirname = blob_dirname or SEMQ_DEFAULT_METASTORE_BLOBDIR
+        self.blob_dirpath = os.path.join(self.queue_metastore_path, self.blob_dirname)
+        self.retention_seconds = SEMQ_DEFAULT_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self.blob_store = BlobStore(
+            dirpath=self.blob_dirpath,
+            threshold=SEMQ_DEFAULT_BLOB_THRESHOLD if blob_threshold is None else blob_threshold,
+            retain=self.retention_seconds > 0,
+        )
+        self.group = ConsumerGroupRegistry.validate(group or SEMQ_DEFAULT_CONSUMER_GROUP)
+        # The default group is only registered on its first get; registering it on setup would hold the
+        # partition files of queues consumed by named groups only
+        self.group_requested = group is not None
+        self.group_dirname = group_dirname or SEMQ_DEFAULT_METASTORE_GROUPDIR
+        self.group_registry = ConsumerGroupRegistry(
+            dirpath=os.path.join(self.queue_metastore_path, self.group_dirname),
+        )
+        self.memory_tier_size = SEMQ_DEFAULT_MEMORY_TIER_SIZE if memory_tier_size is None else memory_tier_size
+        self.memory_tier = None
+        # Recover from interrupted operations once per process when opening the queue
+        self.recovery = SEMQ_DEFAULT_RECOVERY_ON_OPEN if recovery is None else recovery
+        if self.recovery and self.queue_metastore_path not in recovered_queue_metastore_paths:
+            self.recover(quick=True)
 
     def setup(self):
         # Create the metastore path if not exists
         os.makedirs(self.queue_metastore_path, exist_ok=True)
         os.makedirs(self.trash_dirpath, exist_ok=True)
+        # Register the consumer group explicitly requested by this instance
+        if self.group_requested:
+            self.register_group()
 
     def cleanup(self, everything: bool = False):
         shutil.rmtree(self.trash_dirpath)
         if everything:
+            memory_tier = self.get_memory_tier()
+            if memory_tier is not None:
+                memory_tier.unlink()
+                self.memory_tier = None
             shutil.rmtree(self.queue_metastore_path)
         self.setup()
 
@@ -54,23 +113,50 @@ class SimpleExternalQueue:
     def discover(cls, metastore_path: Optional[str] = None) -> List[Dict]:
         metastore_path = metastore_path or SEMQ_DEFAULT_METASTORE_PATH
 
-        return [
-            {
-                "name": queue_name,
-                "path": queue_path,
-                "created_at": os.path.getctime(queue_path),
-                "updated_at": os.path.getmtime(queue_path),
+        # Single directory scan; one stat call per queue
+        with os.scandir(metastore_path) as entries:
+            return [
+                {
+                    "name": entry.name,
+                    "path": entry.path,
+                    "created_at": stat.st_ctime,
+                    "updated_at": stat.st_mtime,
 
-            }
-            for queue_name in os.listdir(metastore_path)
-            for queue_path in [os.path.join(metastore_path, queue_name)]
-        ]
+                }
+                for entry in entries
+                for stat in [entry.stat()]
+            ]
+
+    @classmethod
+    def status(
+            cls,
+            metastore_path: Optional[str] = None,
+            pattern: Optional[str] = None,
+            offset: int = 0,
+            limit: Optional[int] = None,
+            min_depth: Optional[int] = None,
+            max_age_seconds: Optional[float] = None,
+            trash_dirname: Optional[str] = None,
+            group_dirname: Optional[str] = None,
+    ) -> Dict:
+        # Depth, oldest item age and throughput of every queue (matching the name pattern) in a single call
+        return stats_cache.status(
+            metastore_path=metastore_path or SEMQ_DEFAULT_METASTORE_PATH,
+            pattern=pattern,
+            offset=offset,
+            limit=limit,
+            min_depth=min_depth,
+            max_age_seconds=SEMQ_DEFAULT_STATS_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds,
+            trash_dirname=trash_dirname,
+            group_dirname=group_dirname,
+        )
 
     def partition_file_operation_put(self, item_hashing: bool = False) -> PartitionFile:
         return PartitionFile.from_path_mode_put(
             max_size=self.partition_file_size,
             path=self.queue_metastore_path,
             item_hashing=item_hashing,
+            blob_store=self.blob_store,
         )
 
     def partition_file_operation_get(
@@ -81,9 +167,78 @@ class SimpleExternalQueue:
             max_size=self.partition_file_size,
             path=self.queue_metastore_path,
             wait_seconds=wait_seconds,
+            blob_store=self.blob_store,
+            group=self.group,
+        )
+
+    def get_memory_tier(self):
+        if self.memory_tier_size <= 0:
+            return None
+        if self.memory_tier is None:
+            from .ring import SharedMemoryRing
+
+            self.memory_tier = SharedMemoryRing(
+                name="semq-" + hashlib.sha1(self.queue_metastore_path.encode("utf-8")).hexdigest()[:20],
+                capacity=self.memory_tier_size,
+                lock_filepath=os.path.join(self.queue_metastore_path, ".memory.lock"),
+                # Items already on disk must be consumed before the ring accepts new ones (FIFO)
+                spilled_on_create=self.get_spilled,
+            )
+        return self.memory_tier
+
+    def is_memory_tier_bypassed(self) -> bool:
+        # Consumer groups need the items to be retained on disk; the memory tier only gets drained
+        return len(self.group_registry.list()) > 1
+
+    def get_spilled(self) -> int:
+        # Items waiting in the partition files for the (single) consumer group
+        groups = self.group_registry.list()
+        return self.size(
+            include_items=True,
+            include_memory=False,
+            group=groups[0] if groups else SEMQ_DEFAULT_CONSUMER_GROUP,
+        )["total_pending_items"]
+
+    def register_group(self, group: Optional[str] = None):
+        group = group or self.group
+        memory_tier = self.get_memory_tier()
+        if memory_tier is not None and len(set(self.group_registry.list()) | {group}) > 1:
+            # The items in the memory tier are delivered to a single group; wait until they are consumed
+            if not memory_tier.when_empty(callback=lambda: self.group_registry.register(group=group)):
+                raise MemoryTierNotEmpty(path=self.queue_metastore_path, group=group)
+            return
+        self.group_registry.register(group=group)
+
+    def ensure_group_registered(self):
+        # Named groups are registered explicitly (setup or register-group); the default one on its first get
+        if self.group_registry.is_registered(group=self.group):
+            return
+        if self.group != SEMQ_DEFAULT_CONSUMER_GROUP:
+            raise ConsumerGroupNotRegistered(group=self.group, path=self.queue_metastore_path)
+        if not os.path.isdir(self.queue_metastore_path):
+            # Reads never create the queue
+            raise UnavailablePartitionFiles(path=self.queue_metastore_path)
+        self.register_group()
+
+    def put(self, item: str, item_hashing: bool = False, durable: bool = False) -> Dict:
+        memory_tier = self.get_memory_tier()
+        if memory_tier is None:
+            return self.put_to_partition_files(item=item, item_hashing=item_hashing)
+        # The disk writes happen while holding the memory tier lock; the spilled counter always matches the backlog
+        spill = functools.partial(self.put_to_partition_files, item=item, item_hashing=item_hashing)
+        # Groups registered meanwhile are checked again while holding the memory tier lock
+        if durable or self.is_memory_tier_bypassed() or self.blob_store.should_spill(item=item):
+            return memory_tier.spill(spill=spill, accept=lambda: not self.is_memory_tier_bypassed())
+        payload = PartitionFile.create_payload(item=item, item_hashing=item_hashing)
+        record = json.dumps(payload).encode("utf-8")
+        spilled_payload = memory_tier.try_push(
+            record=record,
+            spill=spill,
+            accept=lambda: not self.is_memory_tier_bypassed(),
         )
+        return payload if spilled_payload is None else spilled_payload
 
-    def put(self, item: str, item_hashing: bool = False) -> Dict:
+    def put_to_partition_files(self, item: str, item_hashing: bool = False) -> Dict:
         partition_file = self.partition_file_operation_put(item_hashing=item_hashing)
         payload, _ = partition_file.append(item=item)
         return payload
@@ -93,8 +248,13 @@ class SimpleExternalQueue:
             wait_seconds: int = -1,
     ) -> Tuple[RequestFile, str]:
         request_id = str(uuid.uuid4())
+        # Partition files are retired only after every registered group consumed them
+        self.ensure_group_registered()
         request_file = self.partition_file_operation_get(wait_seconds=wait_seconds).get_request_file(
-            trash_dirpath=self.trash_dirpath
+            trash_dirpath=self.trash_dirpath,
+            group=self.group,
+            group_registry=self.group_registry,
+            on_retire=self.apply_retention_if_due,
         )
         return request_file.request(request_id=request_id, wait_seconds=wait_seconds), request_id
 
@@ -103,6 +263,59 @@ class SimpleExternalQueue:
             wait_seconds: int = -1,
             fail: bool = False,
             exclude_metadata: bool = False,
+            resolve_blobs: bool = False,
+    ) -> Optional[Dict]:
+        memory_tier = None
+        if self.memory_tier_size > 0:
+            # Register before popping; the memory tier items must not be delivered to unregistered groups
+            try:
+                self.ensure_group_registered()
+            except UnavailablePartitionFiles:
+                if fail:
+                    raise
+                return None
+            memory_tier = self.get_memory_tier()
+        if memory_tier is None:
+            return self.get_from_partition_files(
+                wait_seconds=wait_seconds,
+                fail=fail,
+                exclude_metadata=exclude_metadata,
+                resolve_blobs=resolve_blobs,
+            )
+        while True:
+            # The memory tier always holds the oldest items; spilled items are only written once it is in use
+            record = memory_tier.pop()
+            if record is not None:
+                payload = json.loads(record)
+                payload["item_request_id"] = str(uuid.uuid4())
+                payload["item_request_file"] = None
+                payload["item_retrieved_at"] = dt.datetime.utcnow().isoformat()
+                return payload.get("item") if exclude_metadata else payload
+            if self.is_memory_tier_bypassed():
+                # Drained; the partition files hold the remaining items of every group
+                return self.get_from_partition_files(
+                    wait_seconds=wait_seconds,
+                    fail=fail,
+                    exclude_metadata=exclude_metadata,
+                    resolve_blobs=resolve_blobs,
+                )
+            payload = memory_tier.consume_spilled(
+                consume=functools.partial(self.get_from_partition_files, wait_seconds=-1, resolve_blobs=resolve_blobs),
+            )
+            if payload is not None:
+                return payload.get("item") if exclude_metadata else payload
+            if wait_seconds < 1:
+                if fail:
+                    raise UnavailablePartitionFiles(path=self.queue_metastore_path)
+                return None
+            time.sleep(wait_seconds)
+
+    def get_from_partition_files(
+            self,
+            wait_seconds: int = -1,
+            fail: bool = False,
+            exclude_metadata: bool = False,
+            resolve_blobs: bool = False,
     ) -> Optional[Dict]:
         try:
             request_file, request_id = self.get_request(wait_seconds=wait_seconds)
@@ -121,7 +334,26 @@ class SimpleExternalQueue:
             with open(request_file.partition_file.filepath, "r") as pfile:
                 for queue_position, line in enumerate(pfile):
                     if queue_position == i:
-                        payload = json.loads(line.strip())
+                        try:
+                            payload = json.loads(line.strip())
+                        except json.JSONDecodeError:
+                            payload = {}
+                        checksum = payload.get("record_checksum")
+                        if not payload or (checksum and checksum != get_record_checksum(payload=payload)):
+                            raise CorruptedRecordInPartitionFile(
+                                position=i,
+                                partition_file=request_file.partition_file.filepath,
+                            )
+                        # Spilled items are returned as a lazy blob handle unless requested otherwise
+                        if "item_blob" in payload:
+                            blob = self.blob_store.open(
+                                reference=payload["item_blob"],
+                                partition_filepath=request_file.partition_file.filepath,
+                            )
+                            payload["item"] = blob
+                            if resolve_blobs:
+                                with blob:
+                                    payload["item"] = blob.read_text()
                         if exclude_metadata:
                             return payload.get("item")
                         payload["item_request_id"] = request_id
@@ -133,20 +365,103 @@ class SimpleExternalQueue:
                 raise
             return
 
+    def recover(self, full: bool = False, grace_seconds: Optional[float] = None, quick: bool = False) -> Dict:
+        recovered_queue_metastore_paths.add(self.queue_metastore_path)
+        # Recount the spilled items (e.g. a producer crashed while spilling) on explicit recoveries only
+        memory_tier = self.get_memory_tier() if not quick and os.path.isdir(self.queue_metastore_path) else None
+        if memory_tier is not None and not self.is_memory_tier_bypassed():
+            memory_tier.reset_spilled(spilled=self.get_spilled)
+        return MetastoreRecovery(
+            queue_metastore_path=self.queue_metastore_path,
+            trash_dirpath=self.trash_dirpath,
+            group_registry=self.group_registry,
+            blob_store=self.blob_store,
+            grace_seconds=SEMQ_DEFAULT_RECOVERY_GRACE_SECONDS if grace_seconds is None else grace_seconds,
+        ).run(full=full, quick=quick)
+
+    def partition_replay(self) -> PartitionReplay:
+        return PartitionReplay(
+            queue_metastore_path=self.queue_metastore_path,
+            trash_dirpath=self.trash_dirpath,
+            blob_store=self.blob_store,
+        )
+
+    def apply_retention(self) -> List[str]:
+        return self.partition_replay().apply_retention(retention_seconds=self.retention_seconds)
+
+    def apply_retention_if_due(self) -> List[str]:
+        # Applied as partition files get retired; at most once every SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS
+        return self.partition_replay().apply_retention_if_due(retention_seconds=self.retention_seconds)
+
+    def replay(
+            self,
+            since: Optional[Union[str, float, dt.datetime]] = None,
+            until: Optional[Union[str, float, dt.datetime]] = None,
+            resolve_blobs: bool = False,
+    ) -> Iterator[Dict]:
+        # Streams the retained and active items created within [since, until); items are not consumed
+        return self.partition_replay().replay(since=since, until=until, resolve_blobs=resolve_blobs)
+
+    def groups(self) -> List[str]:
+        return self.group_registry.list()
+
+    def unregister_group(self, group: Optional[str] = None) -> List[str]:
+        group = group or self.group
+        self.group_registry.unregister(group=group)
+        groups = self.group_registry.list()
+        files: List[str] = []
+        PartitionFile.files_info(path=self.queue_metastore_path, accum=files)
+        retired = []
+        for file in sorted(files):
+            partition_file = PartitionFile(
+                filepath=os.path.join(self.queue_metastore_path, file),
+                max_size=self.partition_file_size,
+                blob_store=self.blob_store,
+            )
+            # Drop the cursor files of the unregistered group
+            for filepath in [
+                FilePrefix.apply_prefix_request(filepath=partition_file.filepath, group=group),
+                FilePrefix.apply_prefix_done(filepath=partition_file.filepath, group=group),
+            ]:
+                if os.path.exists(filepath):
+                    AbstractFile(filepath=filepath).soft_delete(trash_dirpath=self.trash_dirpath)
+            # Partition files may now be consumed by all the remaining groups
+            if groups and partition_file.retire_if_completed(groups=groups, trash_dirpath=self.trash_dirpath):
+                retired.append(partition_file.filepath)
+        if retired:
+            self.apply_retention_if_due()
+        # Back to a single group; the memory tier takes new items once the items on disk are consumed
+        memory_tier = self.get_memory_tier()
+        if memory_tier is not None and not self.is_memory_tier_bypassed():
+            memory_tier.reset_spilled(spilled=self.get_spilled)
+        return retired
+
     def is_empty(self) -> bool:
-        _, _, files, _ = PartitionFile.files_info(path=self.queue_metastore_path)
+        _, _, files, _ = PartitionFile.files_info(path=self.queue_metastore_path, group=self.group)
         return files == 0
 
-    def size(self, include_items: bool = False, ignore_requests: bool = False):
+    def size(
+            self,
+            include_items: bool = False,
+            ignore_requests: bool = False,
+            include_memory: bool = True,
+            group: Optional[str] = None,
+    ):
+        group = group or self.group
         payload = {
             "timestamp": dt.datetime.utcnow().isoformat(),
         }
         files = [] if include_items else None
         _, _, num_files, file_names = PartitionFile.files_info(
             path=self.queue_metastore_path,
-            accum=files
+            accum=files,
+            group=group,
         )
         payload["active_partition_files"] = num_files
+        memory_tier = self.get_memory_tier() if include_memory else None
+        memory_stats = memory_tier.stats() if memory_tier is not None else None
+        if memory_stats is not None:
+            payload["memory_tier"] = memory_stats
         logger.info("Size of active partition files: %d", num_files)
         if not include_items:
             return payload
@@ -154,21 +469,14 @@ class SimpleExternalQueue:
         requests = 0
         for file_name in files:
             file_path = os.path.join(self.queue_metastore_path, file_name)
-            with open(file_path, "r") as pfile:
-                for i, _ in enumerate(pfile):
-                    pass
-            items += i + 1
+            items += AbstractFile(filepath=file_path).size
             if ignore_requests:
                 continue
-            request_file = FilePrefix.apply_prefix_request(file_path)
-            if os.path.exists(request_file):
-                with open(request_file, "r") as rfile:
-                    for i, _ in enumerate(rfile):
-                        pass
-                requests += i + 1
+            requests += AbstractFile(filepath=FilePrefix.apply_prefix_request(file_path, group=group)).size
+        memory_items = memory_stats["items"] if memory_stats is not None else 0
         return {
             **payload,
-            "total_pending_items": items - requests,
+            "total_pending_items": items - requests + memory_items,
             "total_items_in_pfiles": items,
             "total_requests_in_rfiles": requests,
         }
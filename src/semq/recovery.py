@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import shutil
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+from .blobstore import BlobStore
+from .metastore import AbstractFile, FilePrefix, PartitionFile, ConsumerGroupRegistry
+from .utils import get_record_checksum
+from .settings import (
+    get_logger,
+    SEMQ_DEFAULT_CONSUMER_GROUP,
+)
+
+
+logger = get_logger(name=__name__)
+
+
+def is_valid_record(line: bytes) -> bool:
+    try:
+        payload = json.loads(line)
+    except ValueError:
+        return False
+    if not isinstance(payload, dict):
+        return False
+    checksum = payload.get("record_checksum")
+    # Records written before the checksums were introduced are only validated as json
+    return not checksum or checksum == get_record_checksum(payload=payload)
+
+
+def is_valid_request(line: bytes) -> bool:
+    # Request identifiers are uuid4 strings
+    return len(line) == 36 and line.count(b"-") == 4
+
+
+@dataclass
+class MetastoreRecovery:
+    queue_metastore_path: str
+    trash_dirpath: str
+    group_registry: ConsumerGroupRegistry
+    blob_store: Optional[BlobStore] = None
+    grace_seconds: float = 60
+
+    def is_stale(self, path: str) -> bool:
+        # Recently modified files may belong to a live operation; only stale files are repaired
+        try:
+            return time.time() - os.path.getmtime(path) >= self.grace_seconds
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def last_line(file, end: int, chunk_size: int = 4096) -> Tuple[int, bytes]:
+        # Scan backwards for the newline preceding the last line (the trailing newline, if any, is skipped)
+        position = max(end - 1, 0)
+        buffer = b""
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            buffer = file.read(position - start) + buffer
+            index = buffer.rfind(b"\n")
+            if index >= 0:
+                line_start = start + index + 1
+                file.seek(line_start)
+                return line_start, file.read(end - line_start)
+            position = start
+        file.seek(0)
+        return 0, file.read(end)
+
+    @classmethod
+    def repair_tail(cls, filepath: str, validate: Callable[[bytes], bool]) -> int:
+        # Truncates the torn (or invalid) records at the end of the file; returns the amount of truncated bytes
+        with open(filepath, "rb+") as file:
+            original = end = file.seek(0, os.SEEK_END)
+            while end:
+                start, line = cls.last_line(file=file, end=end)
+                if line.endswith(b"\n") and validate(line[:-1]):
+                    break
+                end = start
+            if end != original:
+                file.truncate(end)
+        return original - end
+
+    @staticmethod
+    def count_lines(filepath: str) -> int:
+        if not os.path.exists(filepath):
+            return 0
+        with open(filepath, "rb") as file:
+            return sum(1 for _ in file)
+
+    @staticmethod
+    def get_partition_name(filename: str) -> Optional[str]:
+        # Works for req-<partition>, req-<group>-<partition>, done-<...>, idx-<...> and retire-<partition> names
+        prefix, separator, _ = filename.partition("-")
+        prefix_options = (FilePrefix.REQ.value, FilePrefix.DONE.value, FilePrefix.IDX.value, FilePrefix.RETIRE.value)
+        if not separator or prefix not in prefix_options:
+            return None
+        return FilePrefix.get_partition_name(filename=filename)
+
+    def find(self, filepath: str) -> Optional[str]:
+        # Locate a file either in the active directory or in the trash directory
+        if os.path.exists(filepath):
+            return filepath
+        trash_filepath = os.path.join(self.trash_dirpath, os.path.basename(FilePrefix.apply_prefix_delete(filepath)))
+        return trash_filepath if os.path.exists(trash_filepath) else None
+
+    def restore(self, filepath: str):
+        trash_filepath = os.path.join(self.trash_dirpath, os.path.basename(FilePrefix.apply_prefix_delete(filepath)))
+        if not os.path.exists(filepath) and os.path.exists(trash_filepath):
+            shutil.move(trash_filepath, filepath)
+
+    def get_companions(self, partition_filepath: str) -> List[str]:
+        # Request and done files of every consumer group
+        return [
+            companion
+            for group in self.group_registry.list() or [SEMQ_DEFAULT_CONSUMER_GROUP]
+            for companion in [
+                FilePrefix.apply_prefix_request(filepath=partition_filepath, group=group),
+                FilePrefix.apply_prefix_done(filepath=partition_filepath, group=group),
+            ]
+        ]
+
+    def retire(self, partition_filepath: str):
+        PartitionFile(filepath=partition_filepath, max_size=0, blob_store=self.blob_store).retire(
+            trash_dirpath=self.trash_dirpath,
+            companion_filepaths=[
+                companion
+                for companion in self.get_companions(partition_filepath=partition_filepath)
+                if os.path.exists(companion)
+            ],
+        )
+
+    def recover_retirement(self, partition_filepath: str) -> bool:
+        # Returns True if the partition file was restored, False if its retirement got completed
+        groups = self.group_registry.list() or [SEMQ_DEFAULT_CONSUMER_GROUP]
+        companions = self.get_companions(partition_filepath=partition_filepath)
+        index_filepath = FilePrefix.apply_prefix_index(filepath=partition_filepath)
+        located = self.find(filepath=partition_filepath)
+        items = self.count_lines(filepath=located) if located else 0
+        unclaimed = False
+        for group in groups:
+            if self.find(FilePrefix.apply_prefix_done(filepath=partition_filepath, group=group)):
+                continue
+            request_filepath = self.find(FilePrefix.apply_prefix_request(filepath=partition_filepath, group=group))
+            requests = self.count_lines(filepath=request_filepath) if request_filepath else 0
+            unclaimed = unclaimed or requests < items
+        if located and unclaimed:
+            logger.warning("Restoring partition file with unclaimed items: %s", partition_filepath)
+            for filepath in [partition_filepath, index_filepath, *companions]:
+                self.restore(filepath=filepath)
+        else:
+            self.retire(partition_filepath=partition_filepath)
+        intent_filepath = FilePrefix.apply_prefix_retire(filepath=partition_filepath)
+        if os.path.exists(intent_filepath):
+            os.remove(intent_filepath)
+        return located is not None and unclaimed
+
+    def corrupted_records(self, partition_filepath: str) -> List[int]:
+        with open(partition_filepath, "rb") as file:
+            return [
+                position
+                for position, line in enumerate(file)
+                if not is_valid_record(line.rstrip(b"\n"))
+            ]
+
+    def run(self, full: bool = False, quick: bool = False) -> Dict:
+        # The quick run (on open) only checks the retire intents plus the head and tail partition files (and their
+        # request files); the scan of every active partition file, orphan and blob reference is left to fsck
+        report: Dict[str, Any] = {
+            "queue_metastore_path": self.queue_metastore_path,
+            "truncated_partition_files": [],
+            "truncated_request_files": [],
+            "restored_partition_files": [],
+            "retired_partition_files": [],
+            "orphaned_files": [],
+            "orphaned_blob_references": [],
+            "corrupted_records": {},
+        }
+        if not os.path.isdir(self.queue_metastore_path):
+            return report
+        filenames = os.listdir(self.queue_metastore_path)
+        prefix_options = tuple(prefix.value for prefix in FilePrefix)
+        partitions = {
+            filename
+            for filename in filenames
+            if filename.endswith(".json") and not filename.startswith(prefix_options)
+        }
+        # Interrupted retirements (only the stale intents; a live process may be retiring the other ones)
+        for filename in filenames:
+            if not filename.startswith(f"{FilePrefix.RETIRE.value}-"):
+                continue
+            if not self.is_stale(os.path.join(self.queue_metastore_path, filename)):
+                continue
+            partition = self.get_partition_name(filename=filename)
+            if partition is None:
+                continue
+            partition_filepath = os.path.join(self.queue_metastore_path, partition)
+            if self.recover_retirement(partition_filepath=partition_filepath):
+                report["restored_partition_files"].append(partition_filepath)
+                partitions.add(partition)
+            else:
+                report["retired_partition_files"].append(partition_filepath)
+                partitions.discard(partition)
+        # Torn tails of the active partition and request files
+        companion_prefixes = tuple(f"{prefix.value}-" for prefix in (FilePrefix.REQ, FilePrefix.DONE, FilePrefix.IDX))
+        if report["retired_partition_files"] or report["restored_partition_files"]:
+            filenames = os.listdir(self.queue_metastore_path)
+        checked = {min(partitions), max(partitions)} if quick and partitions else partitions
+        for filename in sorted(filenames):
+            filepath = os.path.join(self.queue_metastore_path, filename)
+            partition = self.get_partition_name(filename=filename)
+            if quick and filename not in checked and partition not in checked:
+                continue
+            if filename in partitions:
+                stale = self.is_stale(filepath)
+                if stale and self.repair_tail(filepath=filepath, validate=is_valid_record):
+                    report["truncated_partition_files"].append(filepath)
+                if stale and not os.path.getsize(filepath):
+                    # Nothing left to consume (e.g. the torn record was the first one)
+                    self.retire(partition_filepath=filepath)
+                    report["retired_partition_files"].append(filepath)
+                    partitions.discard(filename)
+                    continue
+                if full:
+                    positions = self.corrupted_records(partition_filepath=filepath)
+                    if positions:
+                        report["corrupted_records"][filepath] = positions
+            elif filename.startswith(f"{FilePrefix.REQ.value}-") and partition in partitions:
+                if self.is_stale(filepath) and self.repair_tail(filepath=filepath, validate=is_valid_request):
+                    report["truncated_request_files"].append(filepath)
+            elif filename.startswith(companion_prefixes) and not quick:
+                # Request/done/index files left behind by a partition file that is not active anymore
+                if partition not in partitions and self.is_stale(filepath):
+                    AbstractFile(filepath=filepath).soft_delete(trash_dirpath=self.trash_dirpath)
+                    report["orphaned_files"].append(filepath)
+        # Blob references left behind by retired partition files
+        if self.blob_store and not quick and os.path.isdir(self.blob_store.refs_dirpath):
+            for partition in os.listdir(self.blob_store.refs_dirpath):
+                reference_dirpath = os.path.join(self.blob_store.refs_dirpath, partition)
+                if partition in partitions or not self.is_stale(reference_dirpath):
+                    continue
+                # Retained partition files (retention policy) keep their blobs until purged
+                retained_filepath = os.path.join(self.trash_dirpath, f"{FilePrefix.DEL.value}-{partition}")
+                if self.blob_store.retain and os.path.exists(retained_filepath):
+                    continue
+                self.blob_store.reclaim(partition_filepath=os.path.join(self.queue_metastore_path, partition))
+                report["orphaned_blob_references"].append(reference_dirpath)
+        for key, value in report.items():
+            if value and key != "queue_metastore_path":
+                logger.warning("Metastore recovery %s: %s", key, value)
+        return report
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import bisect
+import datetime as dt
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from dataclasses import dataclass
+
+from .blobstore import BlobStore
+from .exceptions import BlobReferenceNotFound
+from .metastore import FilePrefix
+from .settings import (
+    get_logger,
+    SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS,
+)
+
+
+logger = get_logger(name=__name__)
+
+
+def to_utc_datetime(value: Union[str, float, dt.datetime]) -> dt.datetime:
+    # Naive UTC datetime; same convention as the `item_created_at` field
+    if isinstance(value, (int, float)):
+        return dt.datetime.utcfromtimestamp(value)
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def get_partition_timestamp(filename: str) -> Optional[float]:
+    # Partition file names are the (utc) creation timestamps; see `get_new_partition_filepath`
+    try:
+        return float(os.path.splitext(filename)[0])
+    except ValueError:
+        return None
+
+
+@dataclass
+class PartitionReplay:
+    queue_metastore_path: str
+    trash_dirpath: str
+    blob_store: Optional[BlobStore] = None
+
+    retention_marker_filename = ".retention"
+
+    def partitions(self) -> List[Tuple[float, str, str]]:
+        # Sorted (timestamp, partition name, current filepath) for the retained and active partition files
+        delete_prefix = f"{FilePrefix.DEL.value}-"
+        candidates = [
+            (filename[len(delete_prefix):], os.path.join(self.trash_dirpath, filename))
+            for filename in (os.listdir(self.trash_dirpath) if os.path.isdir(self.trash_dirpath) else [])
+            if filename.startswith(delete_prefix)
+        ] + [
+            (filename, os.path.join(self.queue_metastore_path, filename))
+            for filename in os.listdir(self.queue_metastore_path)
+        ]
+        partitions = []
+        for partition, filepath in candidates:
+            timestamp = get_partition_timestamp(filename=partition) if partition.endswith(".json") else None
+            if timestamp is not None:
+                partitions.append((timestamp, partition, filepath))
+        return sorted(partitions)
+
+    @staticmethod
+    def seek(filepath: str, since: dt.datetime) -> int:
+        # Byte offset of the last indexed record created before `since` (zero if not indexed)
+        directory, filename = os.path.split(filepath)
+        partition = FilePrefix.get_partition_name(filename=filename)
+        index_filepath = FilePrefix.apply_prefix_index(filepath=os.path.join(directory, partition))
+        if filename != partition:
+            # Retired partition file; the index was moved to the trash along with it
+            index_filepath = FilePrefix.apply_prefix_delete(filepath=index_filepath)
+        if not os.path.exists(index_filepath):
+            return 0
+        offset = 0
+        since_isoformat = since.isoformat()
+        with open(index_filepath, "r") as file:
+            for line in file:
+                try:
+                    _, entry_offset, entry_created_at = line.split()
+                except ValueError:
+                    continue
+                if entry_created_at > since_isoformat:
+                    break
+                offset = int(entry_offset)
+        return offset
+
+    def replay(
+            self,
+            since: Optional[Union[str, float, dt.datetime]] = None,
+            until: Optional[Union[str, float, dt.datetime]] = None,
+            resolve_blobs: bool = False,
+    ) -> Iterator[Dict]:
+        since = to_utc_datetime(since) if since is not None else None
+        until = to_utc_datetime(until) if until is not None else None
+        since_isoformat = since.isoformat() if since is not None else None
+        until_isoformat = until.isoformat() if until is not None else None
+        partitions = self.partitions()
+        # Binary search; the partition containing `since` is the last one created before it
+        start = 0
+        if since is not None:
+            start = max(bisect.bisect_right([timestamp for timestamp, _, _ in partitions], since.timestamp()) - 1, 0)
+        for timestamp, partition, filepath in partitions[start:]:
+            if until is not None and timestamp >= until.timestamp():
+                return
+            offset = self.seek(filepath=filepath, since=since) if since is not None else 0
+            try:
+                file = open(filepath, "rb")
+            except FileNotFoundError:
+                # Retired (or purged) while replaying
+                continue
+            with file:
+                file.seek(offset)
+                for line in file:
+                    try:
+                        payload = json.loads(line)
+                    except ValueError:
+                        continue
+                    created_at = payload.get("item_created_at", "")
+                    if since_isoformat is not None and created_at < since_isoformat:
+                        continue
+                    if until_isoformat is not None and created_at >= until_isoformat:
+                        return
+                    if "item_blob" in payload and self.blob_store:
+                        try:
+                            blob = self.blob_store.open(
+                                reference=payload["item_blob"],
+                                partition_filepath=os.path.join(self.queue_metastore_path, partition),
+                            )
+                        except BlobReferenceNotFound:
+                            logger.warning("Blob not retained for replayed item: %s", payload.get("item_id"))
+                        else:
+                            payload["item"] = blob
+                            if resolve_blobs:
+                                with blob:
+                                    payload["item"] = blob.read_text()
+                    yield payload
+
+    def apply_retention(self, retention_seconds: float, now: Optional[float] = None) -> List[str]:
+        # Purge the retired partition files (and their companion files and blobs) older than the retention
+        if retention_seconds <= 0 or not os.path.isdir(self.trash_dirpath):
+            return []
+        # Same (utcnow-based) convention as the partition file names
+        threshold = (now or dt.datetime.utcnow().timestamp()) - retention_seconds
+        purged = []
+        for filename in os.listdir(self.trash_dirpath):
+            partition = FilePrefix.get_partition_name(filename=filename)
+            timestamp = get_partition_timestamp(filename=partition)
+            if timestamp is None or timestamp >= threshold:
+                continue
+            try:
+                os.remove(os.path.join(self.trash_dirpath, filename))
+            except FileNotFoundError:
+                # Purged by another process meanwhile
+                continue
+            if filename == f"{FilePrefix.DEL.value}-{partition}":
+                purged.append(partition)
+                if self.blob_store:
+                    self.blob_store.reclaim(
+                        partition_filepath=os.path.join(self.queue_metastore_path, partition),
+                        force=True,
+                    )
+        return purged
+
+    def apply_retention_if_due(
+            self,
+            retention_seconds: float,
+            interval_seconds: float = SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS,
+    ) -> List[str]:
+        # Throttled across processes by the modification time of a marker file in the trash
+        if retention_seconds <= 0 or not os.path.isdir(self.trash_dirpath):
+            return []
+        marker_filepath = os.path.join(self.trash_dirpath, self.retention_marker_filename)
+        try:
+            if time.time() - os.path.getmtime(marker_filepath) < interval_seconds:
+                return []
+        except FileNotFoundError:
+            open(marker_filepath, "a").close()
+        os.utime(marker_filepath)
+        return self.apply_retention(retention_seconds=retention_seconds)
@@ -0,0 +1,186 @@
+import sys
+import fcntl
+import struct
+import contextlib
+from typing import Callable, Dict, Iterator, Optional
+from multiprocessing import shared_memory
+
+from .settings import (
+    get_logger,
+)
+
+
+logger = get_logger(name=__name__)
+
+
+def open_shared_memory(name: str, size: int = 0, create: bool = False) -> shared_memory.SharedMemory:
+    # The ring must outlive the processes using it; keep the resource tracker from unlinking it on exit
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(getattr(shm, "_name"), "shared_memory")
+    return shm
+
+
+def unlink_shared_memory(shm: shared_memory.SharedMemory):
+    if sys.version_info < (3, 13):
+        # Unlinking unregisters the segment from the resource tracker; register it back to keep it consistent
+        from multiprocessing import resource_tracker
+        resource_tracker.register(getattr(shm, "_name"), "shared_memory")
+    shm.unlink()
+
+
+class SharedMemoryRing:
+    # Header: magic, capacity, head, tail, count, spilled; followed by the data area.
+    # Records are stored as a length prefix followed by the content, wrapping around the data area.
+    # The head/tail positions are monotonic byte counters; the spilled counter tracks the items written to
+    # the partition files while the ring was in use (the ring only accepts items once they were consumed).
+    header = struct.Struct("<IQQQQq")
+    header_size = 64
+    length = struct.Struct("<I")
+    magic = 0x53454D51
+
+    def __init__(
+            self,
+            name: str,
+            capacity: int,
+            lock_filepath: str,
+            spilled_on_create: Optional[Callable[[], int]] = None,
+    ):
+        self.name = name
+        self.lock_filepath = lock_filepath
+        self._lock_file = open(lock_filepath, "a")
+        with self.lock():
+            try:
+                self.shm = open_shared_memory(name=name, size=self.header_size + capacity, create=True)
+                created = True
+            except FileExistsError:
+                self.shm = open_shared_memory(name=name)
+                created = False
+            buf = self.shm.buf
+            if buf is None:
+                raise ValueError(f"Shared memory segment is closed: {name}")
+            self.buf = buf
+            if created:
+                spilled = spilled_on_create() if spilled_on_create else 0
+                self.header.pack_into(self.buf, 0, self.magic, capacity, 0, 0, 0, spilled)
+                logger.info("Shared memory ring created: %s", name)
+            magic, self.capacity, *_ = self.header.unpack_from(self.buf, 0)
+            if magic != self.magic:
+                raise ValueError(f"Shared memory segment is not a SEMQ ring: {name}")
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        # Cross-process exclusive lock
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _write(self, position: int, data: bytes):
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        start = self.header_size + offset
+        self.buf[start:start + first] = data[:first]
+        if first < len(data):
+            self.buf[self.header_size:self.header_size + len(data) - first] = data[first:]
+
+    def _read(self, position: int, size: int) -> bytes:
+        offset = position % self.capacity
+        first = min(size, self.capacity - offset)
+        start = self.header_size + offset
+        data = bytes(self.buf[start:start + first])
+        if first < size:
+            data += bytes(self.buf[self.header_size:self.header_size + size - first])
+        return data
+
+    def try_push(
+            self,
+            record: bytes,
+            spill: Callable[[], Dict],
+            accept: Optional[Callable[[], bool]] = None,
+    ) -> Optional[Dict]:
+        # Returns None once the record is in the ring; otherwise the item is written to the partition files by the
+        # spill callback (while holding the lock) and its result returned. The items rejected by `accept` are
+        # spilled without being counted.
+        with self.lock():
+            if accept is not None and not accept():
+                return spill()
+            magic, capacity, head, tail, count, spilled = self.header.unpack_from(self.buf, 0)
+            required = self.length.size + len(record)
+            if spilled > 0 or required > capacity - (tail - head):
+                return self._spill(spill=spill)
+            self._write(position=tail, data=self.length.pack(len(record)) + record)
+            self.header.pack_into(self.buf, 0, magic, capacity, head, tail + required, count + 1, spilled)
+            return None
+
+    def _spill(self, spill: Callable[[], Dict]) -> Dict:
+        # Counted before writing; a crashed producer leaves the counter too high (see consume_spilled), never too low
+        magic, capacity, head, tail, count, spilled = self.header.unpack_from(self.buf, 0)
+        self.header.pack_into(self.buf, 0, magic, capacity, head, tail, count, spilled + 1)
+        try:
+            return spill()
+        except BaseException:
+            self.header.pack_into(self.buf, 0, magic, capacity, head, tail, count, spilled)
+            raise
+
+    def spill(self, spill: Callable[[], Dict], accept: Optional[Callable[[], bool]] = None) -> Dict:
+        with self.lock():
+            if accept is not None and not accept():
+                return spill()
+            return self._spill(spill=spill)
+
+    def consume_spilled(self, consume: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        # Reads a spilled item from the partition files while holding the lock; finding none means nothing is spilled
+        with self.lock():
+            payload = consume()
+            magic, capacity, head, tail, count, spilled = self.header.unpack_from(self.buf, 0)
+            spilled = max(spilled - 1, 0) if payload is not None else 0
+            self.header.pack_into(self.buf, 0, magic, capacity, head, tail, count, spilled)
+            return payload
+
+    def reset_spilled(self, spilled: Callable[[], int]):
+        # Recounts the spilled items from the actual backlog; spills and reads of spilled items wait for the lock
+        with self.lock():
+            magic, capacity, head, tail, count, _ = self.header.unpack_from(self.buf, 0)
+            self.header.pack_into(self.buf, 0, magic, capacity, head, tail, count, spilled())
+
+    def when_empty(self, callback: Callable[[], None]) -> bool:
+        # Runs the callback (while holding the lock) only if the ring holds no items
+        with self.lock():
+            _, _, _, _, count, _ = self.header.unpack_from(self.buf, 0)
+            if count:
+                return False
+            callback()
+            return True
+
+    def pop(self) -> Optional[bytes]:
+        with self.lock():
+            magic, capacity, head, tail, count, spilled = self.header.unpack_from(self.buf, 0)
+            if not count:
+                return None
+            size, = self.length.unpack(self._read(position=head, size=self.length.size))
+            record = self._read(position=head + self.length.size, size=size)
+            head += self.length.size + size
+            self.header.pack_into(self.buf, 0, magic, capacity, head, tail, count - 1, spilled)
+            return record
+
+    def stats(self) -> Dict:
+        with self.lock():
+            _, capacity, head, tail, count, spilled = self.header.unpack_from(self.buf, 0)
+        return {
+            "capacity": capacity,
+            "used": tail - head,
+            "items": count,
+            "spilled": spilled,
+        }
+
+    def close(self):
+        self.shm.close()
+        self._lock_file.close()
+
+    def unlink(self):
+        unlink_shared_memory(shm=self.shm)
+        self.close()
@@ -17,3 +17,18 @@ def discover():
     params = request.args.to_dict()
     metastore_path = params.get("metastore_path", SEMQ_DEFAULT_METASTORE_PATH)
     return jsonify(SimpleExternalQueue.discover(metastore_path=metastore_path))
+
+
+@api_discover.route("/status", methods=["GET"])
+def status():
+    params = request.args.to_dict()
+    metastore_path = params.get("metastore_path", SEMQ_DEFAULT_METASTORE_PATH)
+    return jsonify(
+        SimpleExternalQueue.status(
+            metastore_path=metastore_path,
+            pattern=params.get("pattern"),
+            offset=int(params.get("offset", 0)),
+            limit=int(params["limit"]) if "limit" in params else None,
+            min_depth=int(params["min_depth"]) if "min_depth" in params else None,
+        )
+    )
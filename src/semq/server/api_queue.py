@@ -19,7 +19,7 @@ def get():
     wait_seconds = int(params.get("wait_seconds", -1))
     # Create queue instance
     queue = validate_queue_attributes(**params)
-    return jsonify(queue.get(wait_seconds=wait_seconds))
+    return jsonify(queue.get(wait_seconds=wait_seconds, resolve_blobs=True))
 
 
 @api_queue.route("/put", methods=["GET"])
@@ -23,5 +23,6 @@ def validate_queue_attributes(**kwargs) -> SimpleExternalQueue:
     return SimpleExternalQueue(
         name=queue_name,
         metastore_path=metastore_path,
-        item_hashing=True
+        item_hashing=True,
+        group=kwargs.get("group"),
     )
@@ -22,6 +22,80 @@ SEMQ_DEFAULT_PARTITION_SIZE = int(os.environ.get(
     default=3,
 ))
 
+SEMQ_DEFAULT_METASTORE_GROUPDIR = os.environ.get(
+    "SEMQ_DEFAULT_METASTORE_GROUPDIR",
+    default=".groups",
+)
+
+SEMQ_DEFAULT_CONSUMER_GROUP = os.environ.get(
+    "SEMQ_DEFAULT_CONSUMER_GROUP",
+    default="default",
+)
+
+# Files modified within this amount of seconds may still be in use by live processes; recovery leaves them alone
+SEMQ_DEFAULT_RECOVERY_GRACE_SECONDS = float(os.environ.get(
+    "SEMQ_DEFAULT_RECOVERY_GRACE_SECONDS",
+    default=60,
+))
+
+SEMQ_DEFAULT_RECOVERY_ON_OPEN = os.environ.get(
+    "SEMQ_DEFAULT_RECOVERY_ON_OPEN",
+    default="true",
+).lower() in ("true", "1", "yes")
+
+# Size in bytes of the shared-memory ring in front of the partition files (zero disables the memory tier)
+SEMQ_DEFAULT_MEMORY_TIER_SIZE = int(os.environ.get(
+    "SEMQ_DEFAULT_MEMORY_TIER_SIZE",
+    default=0,
+))
+
+# Retired partition files are kept (and replayable) for this amount of seconds; zero keeps the trash untouched
+SEMQ_DEFAULT_RETENTION_SECONDS = float(os.environ.get(
+    "SEMQ_DEFAULT_RETENTION_SECONDS",
+    default=0,
+))
+
+# Retired partition files older than the retention are purged (on retirement) at most once every this amount of seconds
+SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS = float(os.environ.get(
+    "SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS",
+    default=60,
+))
+
+# One sparse time-index entry every this amount of records per partition file
+SEMQ_DEFAULT_TIME_INDEX_INTERVAL = int(os.environ.get(
+    "SEMQ_DEFAULT_TIME_INDEX_INTERVAL",
+    default=64,
+))
+
+# The queue stats are persisted out of the queue directories (their times are reported by `discover`)
+SEMQ_DEFAULT_STATS_CACHE_PATH = os.environ.get(
+    "SEMQ_DEFAULT_STATS_CACHE_PATH",
+    default=os.path.join(os.path.expanduser("~"), ".cache", "semq", "stats"),
+)
+
+# The queue throughput (items per second) is measured over this amount of seconds
+SEMQ_DEFAULT_STATS_WINDOW_SECONDS = float(os.environ.get(
+    "SEMQ_DEFAULT_STATS_WINDOW_SECONDS",
+    default=300,
+))
+
+# Cached queue stats refreshed within this amount of seconds are served as they are
+SEMQ_DEFAULT_STATS_MAX_AGE_SECONDS = float(os.environ.get(
+    "SEMQ_DEFAULT_STATS_MAX_AGE_SECONDS",
+    default=1,
+))
+
+SEMQ_DEFAULT_METASTORE_BLOBDIR = os.environ.get(
+    "SEMQ_DEFAULT_METASTORE_BLOBDIR",
+    default=".blobs",
+)
+
+# Items larger than this amount of bytes are spilled into the blob store (zero or negative disables it)
+SEMQ_DEFAULT_BLOB_THRESHOLD = int(os.environ.get(
+    "SEMQ_DEFAULT_BLOB_THRESHOLD",
+    default=1024 * 1024,
+))
+
 
 SEMQ_DEFAULT_PARTITION_FILE_ENDING = os.environ.get(
     "SEMQ_DEFAULT_PARTITION_FILE_ENDING",
@@ -50,7 +124,9 @@ SEMQ_DEFAULT_LOGGING_LEVEL = os.environ.get(
 
 
 def get_logger(name: str, log_level: Optional[str] = None):
-    logging.basicConfig()
+    # Configure the root logger only once per process
+    if not logging.root.handlers:
+        logging.basicConfig()
     logger = logging.getLogger(name)
     logger.setLevel(log_level or SEMQ_DEFAULT_LOGGING_LEVEL)
     return logger
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import fnmatch
+import threading
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field, asdict, replace
+
+from .metastore import FilePrefix
+from .utils import count_newlines
+from .settings import (
+    get_logger,
+    SEMQ_DEFAULT_CONSUMER_GROUP,
+    SEMQ_DEFAULT_METASTORE_GROUPDIR,
+    SEMQ_DEFAULT_METASTORE_TRASHDIR,
+    SEMQ_DEFAULT_STATS_CACHE_PATH,
+    SEMQ_DEFAULT_STATS_WINDOW_SECONDS,
+)
+
+
+logger = get_logger(name=__name__)
+
+
+@dataclass
+class QueueStats:
+    name: str
+    path: str
+    # Partition and request files are append-only; (size in bytes, lines) lets the refresh read new bytes only
+    files: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    enqueued_total: int = 0
+    dequeued_total: int = 0
+    # (timestamp, enqueued_total, dequeued_total) samples used for the throughput
+    samples: List[Tuple[float, int, int]] = field(default_factory=list)
+    # (partition, position, item_created_at) of the oldest pending item
+    oldest: Optional[Tuple[str, int, Optional[str]]] = None
+    refreshed_at: float = 0
+    summary: Dict = field(default_factory=dict)
+    # Files created and retired between two listings are only found in the trash (by their rename time)
+    listed_at: float = 0
+    trash_mtime: float = 0
+    oldest_partition: Optional[str] = None
+    trash_dirname: str = SEMQ_DEFAULT_METASTORE_TRASHDIR
+    group_dirname: str = SEMQ_DEFAULT_METASTORE_GROUPDIR
+
+    def load(self, filepath: str) -> 'QueueStats':
+        # Restores the persisted counters, if any
+        try:
+            with open(filepath, "r") as file:
+                content = json.load(file)
+            return replace(
+                self,
+                files={key: tuple(value) for key, value in content["files"].items()},
+                enqueued_total=content["enqueued_total"],
+                dequeued_total=content["dequeued_total"],
+                samples=[tuple(sample) for sample in content["samples"]],
+                oldest=tuple(content["oldest"]) if content["oldest"] else None,
+                refreshed_at=content["refreshed_at"],
+                summary=content["summary"],
+                listed_at=content["listed_at"],
+                trash_mtime=content["trash_mtime"],
+                oldest_partition=content["oldest_partition"],
+            )
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return self
+
+    def save(self, filepath: str):
+        # Atomic replace; several processes may refresh the same queue
+        tmp_filepath = f"{filepath}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(tmp_filepath, "w") as file:
+                json.dump(asdict(self), file)
+            os.replace(tmp_filepath, filepath)
+        except OSError:
+            logger.warning("Unable to persist the queue stats: %s", filepath)
+
+    def count_lines(self, filename: str, size: int, filepath: Optional[str] = None) -> int:
+        # Returns the amount of new lines since the last refresh and updates the cached entry
+        filepath = filepath or os.path.join(self.path, filename)
+        previous_size, previous_lines = self.files.get(filename, (0, 0))
+        if size < previous_size:
+            # Truncated (e.g. recovery); count again
+            previous_size, previous_lines = 0, 0
+        new_lines = count_newlines(filepath, start=previous_size, end=size) if size > previous_size else 0
+        self.files[filename] = (size, previous_lines + new_lines)
+        return new_lines
+
+    def account(self, filename: str, new_lines: int):
+        if filename.startswith((f"{FilePrefix.REQ.value}-", f"{FilePrefix.DONE.value}-")):
+            self.dequeued_total += new_lines
+        elif not filename.startswith(tuple(prefix.value for prefix in FilePrefix)):
+            self.enqueued_total += new_lines
+
+    def refresh(self, window_seconds: float = SEMQ_DEFAULT_STATS_WINDOW_SECONDS) -> Dict:
+        listed_at = time.time()
+        filenames = set(os.listdir(self.path))
+        prefix_options = tuple(prefix.value for prefix in FilePrefix)
+        request_prefix = f"{FilePrefix.REQ.value}-"
+        done_prefix = f"{FilePrefix.DONE.value}-"
+        delete_prefix = f"{FilePrefix.DEL.value}-"
+        partitions = sorted(
+            filename
+            for filename in filenames
+            if filename.endswith(".json") and not filename.startswith(prefix_options)
+        )
+        requests = [filename for filename in filenames if filename.startswith((request_prefix, done_prefix))]
+        # Files retired (or completed) since the last refresh; their last appended lines are still accounted
+        trash_dirpath = os.path.join(self.path, self.trash_dirname)
+        tracked = set(self.files)
+        resolved = set()
+        for filename in tracked - filenames:
+            renamed = None
+            candidates = [os.path.join(trash_dirpath, f"{delete_prefix}{filename}")]
+            if filename.startswith(request_prefix):
+                # Consumer groups rename their request file into a done file once the partition is consumed
+                renamed = f"{done_prefix}{filename[len(request_prefix):]}"
+                candidates = [
+                    os.path.join(self.path, renamed),
+                    os.path.join(trash_dirpath, f"{delete_prefix}{renamed}"),
+                    *candidates,
+                ]
+            for candidate in candidates:
+                try:
+                    size = os.path.getsize(candidate)
+                except FileNotFoundError:
+                    continue
+                self.account(filename, self.count_lines(filename=filename, size=size, filepath=candidate))
+                resolved.add(os.path.basename(candidate))
+                break
+            cached = self.files.pop(filename)
+            if renamed in filenames:
+                # Keep tracking the done file; it is listed as an active file below
+                self.files[renamed] = cached
+        try:
+            trash_mtime = os.path.getmtime(trash_dirpath)
+        except FileNotFoundError:
+            trash_mtime = 0
+        if self.oldest_partition is not None and trash_mtime != self.trash_mtime:
+            # Never listed files moved into the trash since the last listing (older partitions were retired before)
+            for filename in os.listdir(trash_dirpath):
+                original = filename[len(delete_prefix):]
+                if (
+                        not filename.startswith(delete_prefix)
+                        or filename in resolved
+                        or original in tracked
+                        or FilePrefix.get_partition_name(filename=original) < self.oldest_partition
+                ):
+                    continue
+                filepath = os.path.join(trash_dirpath, filename)
+                try:
+                    # Renames update the ctime
+                    if not self.listed_at < os.stat(filepath).st_ctime <= listed_at:
+                        continue
+                    self.account(original, count_newlines(filepath))
+                except FileNotFoundError:
+                    continue
+        self.trash_mtime = trash_mtime
+        self.listed_at = listed_at
+        self.oldest_partition = partitions[0] if partitions else (self.oldest_partition or "")
+        # Active files
+        for filename in [*partitions, *requests]:
+            try:
+                size = os.path.getsize(os.path.join(self.path, filename))
+            except FileNotFoundError:
+                continue
+            self.account(filename, self.count_lines(filename=filename, size=size))
+        # Depth per consumer group
+        group_dirpath = os.path.join(self.path, self.group_dirname)
+        groups = sorted(os.listdir(group_dirpath)) if os.path.isdir(group_dirpath) else []
+        depth_by_group = {}
+        heads = []
+        for group in groups or [SEMQ_DEFAULT_CONSUMER_GROUP]:
+            depth = 0
+            head = None
+            for partition in partitions:
+                done_filename = FilePrefix.apply_prefix_done(filepath=partition, group=group)
+                if done_filename in filenames:
+                    continue
+                request_filename = FilePrefix.apply_prefix_request(filepath=partition, group=group)
+                items = self.files.get(partition, (0, 0))[1]
+                claimed = self.files.get(request_filename, (0, 0))[1]
+                depth += max(items - claimed, 0)
+                if head is None and items > claimed:
+                    head = (partition, claimed)
+            depth_by_group[group] = depth
+            if head is not None:
+                heads.append(head)
+        # Oldest pending item (across groups); only re-read when the head moved
+        oldest_head = min(heads) if heads else None
+        if oldest_head is None:
+            self.oldest = None
+        elif self.oldest is None or tuple(self.oldest[:2]) != oldest_head:
+            self.oldest = (*oldest_head, self.read_created_at(*oldest_head))
+        # Throughput over the sample window
+        now = time.time()
+        self.samples = [sample for sample in self.samples if now - sample[0] <= window_seconds]
+        self.samples.append((now, self.enqueued_total, self.dequeued_total))
+        first = self.samples[0]
+        elapsed = now - first[0]
+        oldest_created_at = self.oldest[2] if self.oldest else None
+        self.summary = {
+            "name": self.name,
+            "path": self.path,
+            "depth": max(depth_by_group.values()) if depth_by_group else 0,
+            "depth_by_group": depth_by_group,
+            "active_partition_files": len(partitions),
+            "oldest_item_created_at": oldest_created_at,
+            "oldest_item_age_seconds": (
+                (dt.datetime.utcnow() - dt.datetime.fromisoformat(oldest_created_at)).total_seconds()
+                if oldest_created_at else None
+            ),
+            "enqueue_rate": (self.enqueued_total - first[1]) / elapsed if elapsed > 0 else None,
+            "dequeue_rate": (self.dequeued_total - first[2]) / elapsed if elapsed > 0 else None,
+            "refreshed_at": dt.datetime.utcfromtimestamp(now).isoformat(),
+        }
+        self.refreshed_at = now
+        return self.summary
+
+    def read_created_at(self, partition: str, position: int) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, partition), "r") as file:
+                for i, line in enumerate(file):
+                    if i == position:
+                        return json.loads(line).get("item_created_at")
+        except (FileNotFoundError, ValueError):
+            logger.debug("Unable to read the oldest item of partition file: %s", partition)
+        return None
+
+
+class QueueStatsCache:
+
+    def __init__(self, persist: bool = True, dirpath: Optional[str] = None):
+        self.persist = persist
+        self.dirpath = dirpath or SEMQ_DEFAULT_STATS_CACHE_PATH
+        self.queues: Dict[str, QueueStats] = {}
+        self.lock = threading.Lock()
+
+    def get_filepath(self, path: str) -> str:
+        return os.path.join(self.dirpath, hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest() + ".json")
+
+    def get(
+            self,
+            name: str,
+            path: str,
+            max_age_seconds: float = 0,
+            trash_dirname: Optional[str] = None,
+            group_dirname: Optional[str] = None,
+    ) -> Dict:
+        with self.lock:
+            stats = self.queues.get(path)
+            if stats is None:
+                stats = QueueStats(name=name, path=path)
+                if self.persist:
+                    stats = stats.load(filepath=self.get_filepath(path))
+                self.queues[path] = stats
+            stats.trash_dirname = trash_dirname or SEMQ_DEFAULT_METASTORE_TRASHDIR
+            stats.group_dirname = group_dirname or SEMQ_DEFAULT_METASTORE_GROUPDIR
+        # Serve the cached summary while fresh enough
+        if stats.summary and time.time() - stats.refreshed_at <= max_age_seconds:
+            return stats.summary
+        with self.lock:
+            summary = stats.refresh()
+            if self.persist:
+                stats.save(filepath=self.get_filepath(path))
+        return summary
+
+    def status(
+            self,
+            metastore_path: str,
+            pattern: Optional[str] = None,
+            offset: int = 0,
+            limit: Optional[int] = None,
+            min_depth: Optional[int] = None,
+            max_age_seconds: float = 0,
+            trash_dirname: Optional[str] = None,
+            group_dirname: Optional[str] = None,
+    ) -> Dict:
+        dirnames = {"trash_dirname": trash_dirname, "group_dirname": group_dirname}
+        names = sorted(
+            name
+            for name in os.listdir(metastore_path)
+            if not pattern or fnmatch.fnmatch(name, pattern)
+            for path in [os.path.join(metastore_path, name)]
+            if os.path.isdir(path)
+        )
+        # Only the requested page gets refreshed unless the depth filter needs every matching queue
+        if min_depth is None:
+            total = len(names)
+            page = names[offset:offset + limit if limit is not None else None]
+            queues = [
+                self.get(name, os.path.join(metastore_path, name), max_age_seconds=max_age_seconds, **dirnames)
+                for name in page
+            ]
+        else:
+            queues = [
+                summary
+                for name in names
+                for summary in [
+                    self.get(name, os.path.join(metastore_path, name), max_age_seconds=max_age_seconds, **dirnames)
+                ]
+                if summary["depth"] >= min_depth
+            ]
+            total = len(queues)
+            queues = queues[offset:offset + limit if limit is not None else None]
+        return {
+            "metastore_path": metastore_path,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "queues": queues,
+        }
+
+
+# Process-wide cache; long-lived processes (e.g. the server) refresh the stats incrementally
+stats_cache = QueueStatsCache()
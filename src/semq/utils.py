@@ -1,6 +1,8 @@
+import json
+import zlib
 import datetime as dt
 import os.path
-from typing import Optional
+from typing import Dict, Optional
 
 
 from .settings import (
@@ -17,3 +19,51 @@ def get_new_partition_filepath(
     # Build filename
     filename = str(dt.datetime.utcnow().timestamp()) + file_ending
     return os.path.abspath(os.path.join(file_path, filename))
+
+
+def get_record_checksum(payload: Dict) -> str:
+    # Checksum of the record content (excluding the checksum itself)
+    content = {key: value for key, value in payload.items() if key != "record_checksum"}
+    return format(zlib.crc32(json.dumps(content, sort_keys=True).encode("utf-8")), "08x")
+
+
+def truncate_torn_tail(filepath: str, chunk_size: int = 4096) -> int:
+    # Drops the last line if it is not newline-terminated (a torn write); returns the amount of truncated bytes
+    with open(filepath, "rb+") as file:
+        end = file.seek(0, os.SEEK_END)
+        if not end:
+            return 0
+        file.seek(end - 1)
+        if file.read(1) == b"\n":
+            return 0
+        position = end - 1
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            index = file.read(position - start).rfind(b"\n")
+            if index >= 0:
+                file.truncate(start + index + 1)
+                return end - (start + index + 1)
+            position = start
+        file.truncate(0)
+        return end
+
+
+def count_newlines(
+        filepath: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = 1024 * 1024,
+) -> int:
+    count = 0
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            count += chunk.count(b"\n")
+            if remaining is not None:
+                remaining -= len(chunk)
+    return count
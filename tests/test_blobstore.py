@@ -0,0 +1,54 @@
+import os
+
+from semq.q import SimpleExternalQueue
+
+
+def blob_queue(metastore_path: str, retention_seconds: float = 0) -> SimpleExternalQueue:
+    queue = SimpleExternalQueue(
+        name="example",
+        metastore_path=metastore_path,
+        partition_file_size=2,
+        blob_threshold=16,
+        retention_seconds=retention_seconds,
+    )
+    queue.setup()
+    return queue
+
+
+def objects(queue: SimpleExternalQueue):
+    return sorted(os.listdir(queue.blob_store.objects_dirpath))
+
+
+def test_blobs_spilled_and_reclaimed_on_retirement(tmp_path):
+    queue = blob_queue(metastore_path=str(tmp_path))
+    large_a, large_b = "a" * 100, "b" * 100
+    # Partition files: [large_a, small], [large_a, large_b]
+    for item in [large_a, "small", large_a, large_b]:
+        queue.put(item=item)
+    assert len(objects(queue)) == 2
+
+    payload = queue.get()
+    assert payload["item_blob"]["size"] == 100
+    with payload["item"] as blob:
+        assert blob.read_text() == large_a
+    assert queue.get()["item"] == "small"
+    # Retiring the first partition file keeps the objects still referenced by the second one
+    assert queue.get(resolve_blobs=True)["item"] == large_a
+    assert len(objects(queue)) == 2
+    assert queue.get(resolve_blobs=True)["item"] == large_b
+    assert queue.get() is None
+    assert objects(queue) == []
+
+
+def test_retained_blobs_reclaimed_when_purged(tmp_path):
+    queue = blob_queue(metastore_path=str(tmp_path), retention_seconds=3600)
+    large = "c" * 100
+    for item in [large, "small", "tail"]:
+        queue.put(item=item)
+    assert [queue.get(resolve_blobs=True)["item"] for _ in range(3)] == [large, "small", "tail"]
+
+    # Retired but still replayable
+    assert [payload["item"] for payload in queue.replay(resolve_blobs=True)][:2] == [large, "small"]
+    assert len(objects(queue)) == 1
+    assert queue.partition_replay().apply_retention(retention_seconds=1, now=4102444800)
+    assert objects(queue) == []
@@ -0,0 +1,25 @@
+import pytest
+from fire.parser import DefaultParseValue
+
+from semq.cli import parse_fast_path_arguments, parse_fast_path_value
+
+
+@pytest.mark.parametrize("value", [
+    "hello", "hello world", "5", "-3", "1.5", "True", "false", "None", "a-b", "a.b", "x#y", "#x", "",
+    "[1, 2]", "{a: 1}", "{'a': [b, None]}", '"quoted"', "(1,)", "f(x)", "1e3",
+])
+def test_fast_path_values_parse_like_fire(value):
+    parsed = parse_fast_path_value(value)
+    assert parsed == DefaultParseValue(value)
+    assert type(parsed) is type(DefaultParseValue(value))
+
+
+def test_fast_path_falls_back_on_unexpected_values():
+    assert parse_fast_path_arguments(["put", "--name", "q", "--item", "{a: 1}"]) == (
+        "put", {"name": "q", "item": {"a": 1}},
+    )
+    # `fire` parses these differently from a plain flag value; it handles them
+    assert parse_fast_path_arguments(["get", "--name", "123"]) is None
+    assert parse_fast_path_arguments(["get", "--name", "q", "--fail=false"]) is None
+    assert parse_fast_path_arguments(["get", "--name", "q", "--wait-seconds", "True"]) is None
+    assert parse_fast_path_arguments(["get", "--name", "q", "--group", "--fail"]) is None
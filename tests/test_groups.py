@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from semq.q import SimpleExternalQueue
+from semq.metastore import PartitionFile
+from semq.exceptions import ConsumerGroupNotRegistered, UnavailablePartitionFiles
+
+
+def drain(queue: SimpleExternalQueue):
+    items = []
+    while True:
+        payload = queue.get()
+        if payload is None:
+            return items
+        items.append(payload["item"])
+
+
+def test_setup_without_group_does_not_hold_named_groups(tmp_path):
+    metastore_path = str(tmp_path)
+    queue = SimpleExternalQueue(name="example", metastore_path=metastore_path, partition_file_size=3)
+    queue.setup()
+    analytics = SimpleExternalQueue(name="example", metastore_path=metastore_path, group="analytics")
+    analytics.setup()
+    archive = SimpleExternalQueue(name="example", metastore_path=metastore_path, group="archive")
+    archive.setup()
+    items = [f"item-{i}" for i in range(7)]
+    for item in items:
+        queue.put(item=item)
+
+    assert drain(analytics) == items
+    assert drain(archive) == items
+    assert queue.groups() == ["analytics", "archive"]
+    # Only the youngest partition file (still open to producers) is left
+    _, _, files, _ = PartitionFile.files_info(path=queue.queue_metastore_path)
+    assert files == 1
+    status = SimpleExternalQueue.status(metastore_path=metastore_path, max_age_seconds=0)
+    assert status["queues"][0]["depth_by_group"] == {"analytics": 0, "archive": 0}
+
+
+def test_group_consumer_with_larger_partition_size(tmp_path):
+    metastore_path = str(tmp_path)
+    producer = SimpleExternalQueue(name="example", metastore_path=metastore_path, partition_file_size=3)
+    for group in ["g1", "g2"]:
+        SimpleExternalQueue(name="example", metastore_path=metastore_path, group=group).setup()
+    items = [f"item-{i}" for i in range(7)]
+    for item in items:
+        producer.put(item=item)
+
+    consumer = SimpleExternalQueue(name="example", metastore_path=metastore_path, group="g1", partition_file_size=10)
+    assert drain(consumer) == items
+
+
+def test_unregistered_group_raises(tmp_path):
+    metastore_path = str(tmp_path)
+    analytics = SimpleExternalQueue(name="example", metastore_path=metastore_path, group="analytics")
+    analytics.setup()
+    analytics.put(item="item-0")
+
+    typo = SimpleExternalQueue(name="example", metastore_path=metastore_path, group="analytcs")
+    with pytest.raises(ConsumerGroupNotRegistered):
+        typo.get()
+    assert analytics.groups() == ["analytics"]
+    assert drain(analytics) == ["item-0"]
+
+
+@pytest.mark.parametrize("memory_tier_size", [0, 512])
+def test_get_does_not_create_the_queue(tmp_path, memory_tier_size):
+    metastore_path = str(tmp_path)
+    queue = SimpleExternalQueue(name="missing", metastore_path=metastore_path, memory_tier_size=memory_tier_size)
+    assert queue.get() is None
+    with pytest.raises(UnavailablePartitionFiles):
+        queue.get(fail=True)
+    assert os.listdir(metastore_path) == []
+    assert SimpleExternalQueue.discover(metastore_path=metastore_path) == []
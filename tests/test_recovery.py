@@ -0,0 +1,65 @@
+import os
+
+from semq.q import SimpleExternalQueue
+from semq.metastore import FilePrefix, PartitionFile
+
+
+def active_partition_filepaths(queue: SimpleExternalQueue):
+    files = []
+    PartitionFile.files_info(path=queue.queue_metastore_path, accum=files)
+    return [os.path.join(queue.queue_metastore_path, file) for file in sorted(files)]
+
+
+def tear(filepath: str, content: str = '{"item": "torn'):
+    with open(filepath, "a") as file:
+        file.write(content)
+
+
+def test_append_after_torn_record(tmp_path):
+    queue = SimpleExternalQueue(name="example", metastore_path=str(tmp_path), partition_file_size=10)
+    queue.setup()
+    queue.put(item="one")
+    queue.put(item="two")
+    tear(active_partition_filepaths(queue)[-1])
+    # The producer does not wait for the recovery grace period
+    queue.put(item="three")
+
+    assert [queue.get()["item"] for _ in range(3)] == ["one", "two", "three"]
+    assert queue.recover(full=True, grace_seconds=0)["corrupted_records"] == {}
+
+
+def make_stale(filepath: str):
+    os.utime(filepath, (0, 0))
+
+
+def test_recovery_retires_emptied_partition_file(tmp_path):
+    queue = SimpleExternalQueue(name="example", metastore_path=str(tmp_path), partition_file_size=10)
+    queue.setup()
+    queue.put(item="one")
+    queue.get()
+    # Torn first record of the (new) youngest partition file
+    partition_filepath = PartitionFile.new(path=queue.queue_metastore_path, max_size=10).filepath
+    tear(partition_filepath)
+    make_stale(partition_filepath)
+
+    report = queue.recover()
+    assert report["truncated_partition_files"] == [partition_filepath]
+    assert partition_filepath in report["retired_partition_files"]
+    assert not os.path.exists(partition_filepath)
+    assert queue.get() is None
+    assert queue.size(include_items=True)["total_pending_items"] == 0
+
+
+def test_size_with_empty_files(tmp_path):
+    queue = SimpleExternalQueue(name="example", metastore_path=str(tmp_path), partition_file_size=10)
+    queue.setup()
+    queue.put(item="one")
+    queue.put(item="two")
+    partition_filepath = active_partition_filepaths(queue)[0]
+    # Empty request file along with an empty (just created) partition file
+    open(FilePrefix.apply_prefix_request(filepath=partition_filepath), "w").close()
+    PartitionFile.new(path=queue.queue_metastore_path, max_size=10)
+
+    assert queue.size(include_items=True)["total_pending_items"] == 2
+    assert [queue.get()["item"] for _ in range(2)] == ["one", "two"]
+    assert queue.get() is None
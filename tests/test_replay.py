@@ -0,0 +1,55 @@
+import os
+import time
+
+from semq.q import SimpleExternalQueue
+from semq.metastore import FilePrefix
+
+
+def trashed_partitions(queue: SimpleExternalQueue):
+    prefix = f"{FilePrefix.DEL.value}-"
+    return sorted(
+        filename[len(prefix):]
+        for filename in os.listdir(queue.trash_dirpath)
+        if filename.startswith(prefix) and filename.endswith(".json") and filename.count("-") == 1
+    )
+
+
+def test_replay_across_retained_and_active_partition_files(tmp_path):
+    queue = SimpleExternalQueue(
+        name="example",
+        metastore_path=str(tmp_path),
+        partition_file_size=2,
+        retention_seconds=3600,
+    )
+    queue.setup()
+    payloads = [queue.put(item=f"item-{i}") for i in range(6)]
+    assert [queue.get()["item"] for _ in range(3)] == ["item-0", "item-1", "item-2"]
+    assert len(trashed_partitions(queue)) == 1
+
+    assert [payload["item"] for payload in queue.replay()] == [payload["item"] for payload in payloads]
+    replayed = queue.replay(since=payloads[1]["item_created_at"], until=payloads[4]["item_created_at"])
+    assert [payload["item"] for payload in replayed] == ["item-1", "item-2", "item-3"]
+    # Replaying does not consume
+    assert [queue.get()["item"] for _ in range(3)] == ["item-3", "item-4", "item-5"]
+
+
+def test_retention_applied_on_retirement(tmp_path):
+    queue = SimpleExternalQueue(
+        name="example",
+        metastore_path=str(tmp_path),
+        partition_file_size=2,
+        retention_seconds=0.01,
+    )
+    queue.setup()
+    for i in range(6):
+        queue.put(item=f"item-{i}")
+    time.sleep(0.02)
+    # Retiring the first partition file purges the expired ones
+    assert [queue.get()["item"] for _ in range(3)] == ["item-0", "item-1", "item-2"]
+    assert trashed_partitions(queue) == []
+
+    # Throttled until SEMQ_DEFAULT_RETENTION_INTERVAL_SECONDS elapsed
+    assert [queue.get()["item"] for _ in range(2)] == ["item-3", "item-4"]
+    assert len(trashed_partitions(queue)) == 1
+    assert len(queue.apply_retention()) == 1
+    assert trashed_partitions(queue) == []
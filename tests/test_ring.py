@@ -0,0 +1,89 @@
+import multiprocessing
+
+import pytest
+
+from semq.q import SimpleExternalQueue
+from semq.exceptions import MemoryTierNotEmpty
+
+
+def memory_tier_queue(metastore_path: str, group=None) -> SimpleExternalQueue:
+    return SimpleExternalQueue(name="example", metastore_path=metastore_path, group=group, memory_tier_size=512)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = memory_tier_queue(metastore_path=str(tmp_path))
+    queue.setup()
+    yield queue
+    queue.cleanup(everything=True)
+
+
+def produce(metastore_path: str, items):
+    for item in items:
+        memory_tier_queue(metastore_path=metastore_path).put(item=item)
+
+
+def test_spilled_items_keep_fifo_order(queue):
+    items = [f"item-{i}" for i in range(10)]
+    for item in items[:5]:
+        queue.put(item=item)
+    stats = queue.get_memory_tier().stats()
+    assert 0 < stats["items"] < 5
+    assert stats["spilled"] == 5 - stats["items"]
+
+    # The ring does not take new items until the spilled ones are consumed
+    consumed = [queue.get()["item"] for _ in range(2)]
+    for item in items[5:]:
+        queue.put(item=item)
+    consumed.extend(payload["item"] for payload in iter(queue.get, None))
+    assert consumed == items
+    assert queue.get_memory_tier().stats()["spilled"] == 0
+
+
+def test_items_produced_by_another_process(queue):
+    items = [f"item-{i}" for i in range(10)]
+    process = multiprocessing.Process(target=produce, args=(queue.metastore_path, items))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert [payload["item"] for payload in iter(queue.get, None)] == items
+
+
+def test_group_registration_waits_for_the_memory_tier(queue):
+    analytics = memory_tier_queue(metastore_path=queue.metastore_path, group="analytics")
+    analytics.setup()
+    for i in range(3):
+        analytics.put(item=f"k{i}")
+    archive = memory_tier_queue(metastore_path=queue.metastore_path, group="archive")
+    with pytest.raises(MemoryTierNotEmpty):
+        archive.setup()
+    assert [analytics.get()["item"] for _ in range(3)] == ["k0", "k1", "k2"]
+
+    archive.setup()
+    assert analytics.groups() == ["analytics", "archive"]
+    items = [f"k{i}" for i in range(3, 6)]
+    for item in items:
+        analytics.put(item=item)
+    # Multi-group queues bypass the memory tier; every group receives every item
+    assert analytics.get_memory_tier().stats()["items"] == 0
+    assert [analytics.get()["item"] for _ in range(3)] == items
+    assert [archive.get()["item"] for _ in range(3)] == items
+
+
+def test_spilled_counter_heals_after_a_crashed_producer(queue):
+    memory_tier = queue.get_memory_tier()
+    # Counted as spilled but never written to disk
+    memory_tier.spill(spill=dict)
+    queue.put(item="one")
+    assert memory_tier.stats()["spilled"] == 2
+
+    assert queue.get()["item"] == "one"
+    assert queue.get() is None
+    assert memory_tier.stats()["spilled"] == 0
+    queue.put(item="two")
+    assert memory_tier.stats()["items"] == 1
+    # Explicit recoveries recount the spilled items from the partition files
+    memory_tier.spill(spill=dict)
+    queue.recover(full=True)
+    assert memory_tier.stats()["spilled"] == 0
+    assert queue.get()["item"] == "two"
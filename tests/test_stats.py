@@ -0,0 +1,94 @@
+import os
+
+from semq.q import SimpleExternalQueue
+from semq.stats import QueueStatsCache
+
+
+def test_incremental_stats_after_retirement(tmp_path):
+    queue = SimpleExternalQueue(name="example", metastore_path=str(tmp_path / "metastore"), partition_file_size=2)
+    queue.setup()
+    cache = QueueStatsCache(dirpath=str(tmp_path / "cache"))
+    for i in range(3):
+        queue.put(item=f"item-{i}")
+    assert cache.get(queue.name, queue.queue_metastore_path)["depth"] == 3
+
+    queue.get()
+    assert cache.get(queue.name, queue.queue_metastore_path)["depth"] == 2
+    # The second claim of the first partition file is only found in the trash once retired
+    queue.get()
+    queue.get()
+    summary = cache.get(queue.name, queue.queue_metastore_path)
+    stats = cache.queues[queue.queue_metastore_path]
+    assert (stats.enqueued_total, stats.dequeued_total) == (3, 3)
+    assert summary["depth"] == 0
+    assert summary["active_partition_files"] == 1
+
+    # A partition file (and its request file) created and retired between two refreshes
+    for i in range(3, 7):
+        queue.put(item=f"item-{i}")
+    assert [queue.get()["item"] for _ in range(3)] == ["item-3", "item-4", "item-5"]
+    summary = cache.get(queue.name, queue.queue_metastore_path)
+    assert (stats.enqueued_total, stats.dequeued_total) == (7, 6)
+    assert summary["depth"] == 1
+
+
+def test_incremental_stats_after_done_renames(tmp_path):
+    metastore_path = str(tmp_path / "metastore")
+    producer = SimpleExternalQueue(name="example", metastore_path=metastore_path, partition_file_size=2)
+    consumers = [
+        SimpleExternalQueue(
+            name="example",
+            metastore_path=metastore_path,
+            partition_file_size=2,
+            group=group,
+            trash_dirname="trash",
+            group_dirname="groups",
+        )
+        for group in ["analytics", "archive"]
+    ]
+    for consumer in consumers:
+        consumer.setup()
+    cache = QueueStatsCache(dirpath=str(tmp_path / "cache"))
+
+    def refresh():
+        return cache.get(
+            producer.name,
+            producer.queue_metastore_path,
+            trash_dirname="trash",
+            group_dirname="groups",
+        )
+
+    for i in range(3):
+        producer.put(item=f"item-{i}")
+    assert refresh()["depth_by_group"] == {"analytics": 3, "archive": 3}
+
+    analytics, archive = consumers
+    analytics.get()
+    refresh()
+    # Completing the first partition file renames the request file into a done file
+    analytics.get()
+    analytics.get()
+    assert refresh()["depth_by_group"] == {"analytics": 0, "archive": 3}
+    assert cache.queues[producer.queue_metastore_path].dequeued_total == 3
+
+    for _ in range(3):
+        archive.get()
+    assert refresh()["depth_by_group"] == {"analytics": 0, "archive": 0}
+    assert cache.queues[producer.queue_metastore_path].dequeued_total == 6
+
+
+def test_status_leaves_the_queue_directories_untouched(tmp_path):
+    metastore_path = str(tmp_path / "metastore")
+    queue = SimpleExternalQueue(name="example", metastore_path=metastore_path)
+    queue.setup()
+    queue.put(item="item-0")
+    filenames = sorted(os.listdir(queue.queue_metastore_path))
+    discovered = SimpleExternalQueue.discover(metastore_path=metastore_path)
+    cache = QueueStatsCache(dirpath=str(tmp_path / "cache"))
+
+    assert cache.status(metastore_path=metastore_path)["queues"][0]["depth"] == 1
+    assert cache.status(metastore_path=metastore_path)["queues"][0]["depth"] == 1
+    assert SimpleExternalQueue.discover(metastore_path=metastore_path) == discovered
+    assert sorted(os.listdir(queue.queue_metastore_path)) == filenames
+    # Persisted out of the queue directory
+    assert QueueStatsCache(dirpath=str(tmp_path / "cache")).get(queue.name, queue.queue_metastore_path)["depth"] == 1